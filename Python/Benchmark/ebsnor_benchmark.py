@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, Iterator, List
+import numpy as np
+from numpy.typing import NDArray
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ebsnor_core import Backend, CameraDims, EBSnoRFilter, FilterWindows # pylint: disable=wrong-import-position
+
+###############################################################################
+# Settings, replace desired values (all can be overridden from the command line)
+CAMERA_DIM_X = 1280                 # Camera resolution width
+CAMERA_DIM_Y = 720                  # Camera resolution height
+DURATION = 1000000                  # Synthetic stream duration in uS
+DELTA_T = 10000                     # Timestamp delta per slice
+BACKGROUND_RATE = 5e5               # Background (road) events per second
+SNOW_RATE = 2000                    # Snow flakes per second
+EBSNOR_TIME_WINDOW = 10000          # EBSnoR filter time window
+SPATIAL_WINDOWS = [0, 2]            # EBSnoR spatial windows to benchmark
+ADAPTIVE_WINDOWS = [False, True]    # EBSnoR adaptive window settings to benchmark
+BACKENDS = ["numba"]                # EBSnoR backends to benchmark
+MODES = ["batch", "stream"]         # process() per slice, or process_stream()
+MEMORY_SLICES = 10                  # Slices traced for peak memory
+SEED = 0                            # Random seed for the synthetic stream
+###############################################################################
+
+###############################################################################
+# Full grid (--full), minutes to hours depending on the backends
+FULL_BACKGROUND_RATE = 2e6          # Background (road) events per second
+FULL_SPATIAL_WINDOWS = [0, 2, 5]    # EBSnoR spatial windows to benchmark
+FULL_BACKENDS = ["python", "numba"] # EBSnoR backends to benchmark
+###############################################################################
+
+###############################################################################
+# Synthetic snow streaks, loosely following Matlab/SnowModel_v3.m
+STREAK_LENGTH = 40                  # Pixels crossed by each flake
+FLAKE_SPEED = (0.005, 0.05)         # Flake image speed range in pixels/uS
+FLAKE_DIAMETER = (1.0, 4.0)         # Flake image diameter range in pixels
+EDGE_EVENTS = 3                     # Events per flake edge (1 IE + trailing events)
+EDGE_EVENT_SPACING = 20             # uS between events of the same edge
+###############################################################################
+
+EVENT_DTYPE = np.dtype([("x", "<u2"), ("y", "<u2"), ("p", "<i2"), ("t", "<i8")])
+
+def generate_background(
+    rng: np.random.Generator,
+    num_evts: int,
+    duration: int,
+    dims: CameraDims
+) -> NDArray:
+    evts = np.empty(num_evts, dtype=EVENT_DTYPE)
+    evts["x"] = rng.integers(0, dims.width, num_evts)
+    evts["y"] = rng.integers(0, dims.height, num_evts)
+    evts["p"] = rng.integers(0, 2, num_evts)
+    evts["t"] = rng.integers(0, duration, num_evts)
+    return evts
+
+def generate_snow(
+    rng: np.random.Generator,
+    num_flakes: int,
+    duration: int,
+    dims: CameraDims
+) -> NDArray:
+    # Each flake moves in a straight line; every pixel it crosses sees an ON
+    # edge when the flake arrives and an OFF edge once it has passed.
+    start_x = rng.uniform(0, dims.width, num_flakes)[:, np.newaxis]
+    start_y = rng.uniform(0, dims.height, num_flakes)[:, np.newaxis]
+    start_t = rng.uniform(0, duration, num_flakes)[:, np.newaxis]
+    angle = rng.uniform(0, 2 * np.pi, num_flakes)[:, np.newaxis]
+    speed = rng.uniform(*FLAKE_SPEED, num_flakes)[:, np.newaxis]
+    dwell = rng.uniform(*FLAKE_DIAMETER, num_flakes)[:, np.newaxis] / speed
+
+    steps = np.arange(STREAK_LENGTH)[np.newaxis, :]
+    xpos = np.rint(start_x + np.cos(angle) * steps).astype(np.int64)
+    ypos = np.rint(start_y + np.sin(angle) * steps).astype(np.int64)
+    on_t = start_t + steps / speed
+
+    edge = np.arange(EDGE_EVENTS) * EDGE_EVENT_SPACING
+    xs = np.broadcast_to(xpos[..., np.newaxis, np.newaxis], xpos.shape + (2, EDGE_EVENTS))
+    ys = np.broadcast_to(ypos[..., np.newaxis, np.newaxis], ypos.shape + (2, EDGE_EVENTS))
+    ts = np.stack((on_t, on_t + dwell), axis=-1)[..., np.newaxis] + edge
+    ps = np.broadcast_to(np.array([1, 0])[:, np.newaxis], xs.shape)
+
+    xs, ys, ts, ps = (arr.ravel() for arr in (xs, ys, ts, ps))
+    keep = (xs >= 0) & (xs < dims.width) & (ys >= 0) & (ys < dims.height) & (ts < duration)
+    evts = np.empty(np.count_nonzero(keep), dtype=EVENT_DTYPE)
+    evts["x"] = xs[keep]
+    evts["y"] = ys[keep]
+    evts["p"] = ps[keep]
+    evts["t"] = ts[keep]
+    return evts
+
+def generate_events(
+    dims: CameraDims,
+    duration: int,
+    background_rate: float,
+    snow_rate: float,
+    seed: int = SEED
+) -> NDArray:
+    rng = np.random.default_rng(seed)
+    background = generate_background(rng, int(background_rate * duration / 1e6), duration, dims)
+    snow = generate_snow(rng, int(snow_rate * duration / 1e6), duration, dims)
+    evts = np.concatenate((background, snow))
+    return evts[np.argsort(evts["t"], kind="stable")]
+
+def iter_slices(evts: NDArray, delta_t: int) -> Iterator[NDArray]:
+    edges = np.arange(0, evts["t"][-1] + delta_t + 1, delta_t) if len(evts) > 0 else []
+    bounds = np.searchsorted(evts["t"], edges)
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        yield evts[first:last]
+
+def run_case(
+    evts: NDArray,
+    dims: CameraDims,
+    windows: FilterWindows,
+    backend: str,
+    mode: str,
+    adaptive_window: bool,
+    delta_t: int
+) -> Dict[str, Any]:
+    slices = list(iter_slices(evts, delta_t))
+
+    def make_filter() -> EBSnoRFilter:
+        ebsnor_filter = EBSnoRFilter(dims, windows, backend)
+        ebsnor_filter.process(evts[:100], adaptive_window)  # JIT warm-up
+        return ebsnor_filter
+
+    def run_slice(ebsnor_filter: EBSnoRFilter, evt_slice: NDArray) -> int:
+        if mode == "stream":
+            return len(ebsnor_filter.process_stream(evt_slice, adaptive_window))
+        return len(ebsnor_filter.process(evt_slice, adaptive_window))
+
+    ebsnor_filter = make_filter()
+    latencies = np.empty(len(slices))
+    num_kept = 0
+    for idx, evt_slice in enumerate(slices):
+        start = time.perf_counter()
+        num_kept += run_slice(ebsnor_filter, evt_slice)
+        latencies[idx] = time.perf_counter() - start
+    if mode == "stream" and len(slices) > 0:
+        num_kept += len(ebsnor_filter.flush())
+
+    # Memory is traced in a separate pass, tracemalloc slows the timed one down
+    ebsnor_filter = make_filter()
+    tracemalloc.start()
+    for evt_slice in slices[:MEMORY_SLICES]:
+        run_slice(ebsnor_filter, evt_slice)
+    _, peak_mem = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # An empty stream reports zero throughput and latency
+    total_time = latencies.sum()
+    return {
+        "backend": Backend(backend).value,
+        "mode": mode,
+        "width": dims.width,
+        "height": dims.height,
+        "time_window": windows.time_win,
+        "spatial_window": windows.spatial_win,
+        "adaptive_window": adaptive_window,
+        "delta_t": delta_t,
+        "events": len(evts),
+        "slices": len(slices),
+        "events_per_sec": len(evts) / total_time if total_time > 0 else 0.0,
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1e3) if len(slices) > 0 else 0.0,
+        "latency_p99_ms": float(np.percentile(latencies, 99) * 1e3) if len(slices) > 0 else 0.0,
+        "peak_mem_mb": peak_mem / 2**20,
+        "removed_fraction": 1 - num_kept / len(evts) if len(evts) > 0 else 0.0
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark EBSnoR throughput, slice latency and memory on synthetic events.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--width", type=int, default=CAMERA_DIM_X, help="Sensor width")
+    parser.add_argument("--height", type=int, default=CAMERA_DIM_Y, help="Sensor height")
+    parser.add_argument("--duration", type=int, default=DURATION, help="Stream duration in uS")
+    parser.add_argument("--delta-t", type=int, default=DELTA_T, help="Slice duration in uS")
+    parser.add_argument(
+        "--background-rate", type=float, default=None,
+        help=f"Background events/s (default {BACKGROUND_RATE:g}, full {FULL_BACKGROUND_RATE:g})")
+    parser.add_argument("--snow-rate", type=float, default=SNOW_RATE, help="Snow flakes/s")
+    parser.add_argument(
+        "--time-window", type=int, default=EBSNOR_TIME_WINDOW, help="EBSnoR time window")
+    parser.add_argument(
+        "--spatial-window", type=int, nargs="+", default=None,
+        help=f"EBSnoR spatial windows (default {SPATIAL_WINDOWS}, full {FULL_SPATIAL_WINDOWS})")
+    parser.add_argument(
+        "--adaptive-window", type=lambda val: val.lower() in ("1", "true", "yes"), nargs="+",
+        default=ADAPTIVE_WINDOWS, help="EBSnoR adaptive window settings (true/false)")
+    parser.add_argument(
+        "--backend", nargs="+", default=None,
+        help=f"EBSnoR backends (default {BACKENDS}, full {FULL_BACKENDS})")
+    parser.add_argument("--mode", nargs="+", default=MODES, choices=MODES, help="Filter modes")
+    parser.add_argument("--seed", type=int, default=SEED, help="Random seed")
+    parser.add_argument(
+        "--full", action="store_true",
+        help="Benchmark the full grid: denser stream, larger spatial windows, all backends")
+    parser.add_argument("--output", default=None, help="JSON results file (default: stdout)")
+    args = parser.parse_args()
+    if args.background_rate is None:
+        args.background_rate = FULL_BACKGROUND_RATE if args.full else BACKGROUND_RATE
+    if args.spatial_window is None:
+        args.spatial_window = FULL_SPATIAL_WINDOWS if args.full else SPATIAL_WINDOWS
+    if args.backend is None:
+        args.backend = FULL_BACKENDS if args.full else BACKENDS
+
+    dims = CameraDims(args.width, args.height)
+    evts = generate_events(dims, args.duration, args.background_rate, args.snow_rate, args.seed)
+    results: List[Dict[str, Any]] = []
+    for backend in args.backend:
+        for mode in args.mode:
+            for spatial_win in args.spatial_window:
+                for adaptive_win in args.adaptive_window:
+                    windows = FilterWindows(args.time_window, spatial_win)
+                    result = run_case(
+                        evts, dims, windows, backend, mode, adaptive_win, args.delta_t)
+                    results.append(result)
+                    print(
+                        f"{backend:>6} {mode:>6} sw={spatial_win} adaptive={adaptive_win}: "
+                        f"{result['events_per_sec']:.3g} ev/s, "
+                        f"p50 {result['latency_p50_ms']:.2f} ms, "
+                        f"p99 {result['latency_p99_ms']:.2f} ms, "
+                        f"{result['peak_mem_mb']:.1f} MB",
+                        file=sys.stderr
+                    )
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+    else:
+        with open(args.output, "w", encoding="utf-8") as outfile:
+            json.dump(results, outfile, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,15 @@
-from typing import Any, NamedTuple, Tuple
-import numpy as np
-from numpy.typing import NDArray
-from metavision_sdk_core import OnDemandFrameGenerationAlgorithm
-from metavision_sdk_ui import (
-    BaseWindow,
-    Window,
-    UIAction,
-    UIKeyEvent
-)
-from metavision_core.event_io import EventsIterator
+import os
+import sys
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, PYTHON_DIR)
+sys.path.insert(0, os.path.join(PYTHON_DIR, "SimulationAnalysis"))
+from ebsnor_core import CameraDims, EBSnoRFilter, FilterWindows # pylint: disable=wrong-import-position
+from eventsource import EventChunkIterator # pylint: disable=wrong-import-position
 
 ###############################################################################
 # Data paths, replace with corresponding paths on your system
-EVENTS_FILEPATH = ""                # Raw events filepath
+EVENTS_FILEPATH = ""                # Events filepath (.raw, .dat, .mat or .npy)
 ###############################################################################
 
 ###############################################################################
@@ -23,121 +20,25 @@ DELTA_T = 10000                     # Timestamp delta per iteration
 EBSNOR_SPATIAL_WINDOW = 0           # EBSnoR filter spatial window
 EBSNOR_TIME_WINDOW = 10000          # EBSnoR filter time window
 USE_ADAPTIVE_WIN = False            # Enable/Disable EBSnoR adaptive window
+EBSNOR_BACKEND = "numba"            # EBSnoR filter backend ("python" or "numba")
+EBSNOR_NUM_WORKERS = 1              # EBSnoR filter threads (one sensor tile each)
 ###############################################################################
 
-
-class CameraDims(NamedTuple):
-    width: int
-    height: int
-
-class FilterWindows(NamedTuple):
-    time_win: int
-    spatial_win: int
-
-class EBSnoRFilter:
-    def __init__(self, dimensions: CameraDims, windows: FilterWindows) -> None:
-        self.time_window = windows.time_win
-        self.spatial_window = windows.spatial_win
-        self.cam_x = dimensions.width
-        self.cam_y = dimensions.height
-
-    def ie_filter(
-        self,
-        events: Any,
-        time_window: int = 10000,
-        te_depth: int = 10
-    ) -> Tuple[NDArray[np.bool], NDArray[np.uint64]]:
-        datalen = len(events["t"])
-        ie_idx = np.zeros((self.cam_x, self.cam_y), dtype=int)
-        prev_ts = np.zeros((self.cam_x, self.cam_y), dtype=int)
-        prev_p = np.zeros((self.cam_x, self.cam_y), dtype=int)
-
-        is_ie = np.zeros(datalen, dtype=bool)
-        te_data = -1*np.ones((datalen, te_depth), dtype=int)
-        te_idx = np.zeros(datalen, dtype=int)
-
-        iter_ev = zip(events["x"], events["y"], events["p"], events["t"])
-        for idx, (xval, yval, pval, tval) in enumerate(iter_ev):
-            if pval != prev_p[xval][yval] or tval - prev_ts[xval][yval] > time_window:
-                is_ie[idx] = True
-                ie_idx[xval][yval] = idx
-            else:
-                if te_idx[ie_idx[xval][yval]] > te_depth:
-                    continue
-                te_data[ie_idx[xval][yval]][te_idx[xval][yval]] = idx
-                te_idx[ie_idx[xval][yval]] += 1
-            prev_ts[xval][yval] = tval
-            prev_p[xval][yval] = pval
-
-        return is_ie, te_data
-
-    def ebsnor_filter(
-        self,
-        events: Any,
-        is_ie: NDArray[np.bool],
-        te_data: NDArray[np.uint64],
-        adaptive_window: bool = False
-    ) -> NDArray[np.bool]:
-        datalen = len(events["t"])
-        events["x"] += self.spatial_window
-        events["y"] += self.spatial_window
-        pos_ts = -np.inf * np.ones(
-            (self.cam_x + 2 * self.spatial_window, self.cam_y + 2 * self.spatial_window),
-            dtype=int
-        )
-        pos_idx = np.zeros(
-            (self.cam_x + 2 * self.spatial_window, self.cam_y + 2 * self.spatial_window),
-            dtype=int
-        )
-        win = np.arange(-self.spatial_window, self.spatial_window + 1, dtype=int)
-        is_snow = np.zeros(datalen, dtype=bool)
-
-        iter_ev = zip(events["x"], events["y"], events["p"], events["t"])
-        for idx, (xval, yval, pval, tval) in enumerate(iter_ev):
-            if is_ie[idx] and pval < 0:
-                in_range = False
-                if adaptive_window:
-                    in_range = tval - pos_ts[xval][yval] < self.time_window
-                    positions = pos_idx[xval][yval]
-                if not in_range:
-                    in_range = np.less(tval - pos_ts[xval + win][yval + win], self.time_window)
-                    positions = pos_idx[xval + win][yval + win]
-                if in_range.any():
-                    is_snow[idx] = True
-                    te_idx = te_data[idx]
-                    is_snow[te_idx[te_idx > -1]] = True
-                    is_snow[positions[in_range]] = True # type: ignore
-                    te_idx = te_data[positions[in_range]] # type: ignore
-                    is_snow[te_idx[te_idx > 0]] = True
-            elif is_ie[idx]:
-                pos_idx[xval][yval] = idx
-                pos_ts[xval][yval] = idx
-
-        return is_snow
-
-    def process(self, events: Any, adaptive_window: bool = False) -> Any:
-        is_ie, te_data = self.ie_filter(events)
-        is_snow = self.ebsnor_filter(events, is_ie, te_data, adaptive_window)
-
-        new_length = len(events["t"]) - np.count_nonzero(is_snow)
-        new_x = events["x"][np.logical_not(is_snow)]
-        new_y = events["y"][np.logical_not(is_snow)]
-        new_t = events["t"][np.logical_not(is_snow)]
-        new_p = events["p"][np.logical_not(is_snow)]
-
-        events = np.resize(events, new_length)
-        events["x"] = new_x
-        events["y"] = new_y
-        events["t"] = new_t
-        events["p"] = new_p
-
-        return events
-
 def main() -> None:
+    # The Metavision SDK is only needed to display events (and read .raw files)
+    # pylint: disable=import-outside-toplevel
+    from metavision_sdk_core import OnDemandFrameGenerationAlgorithm
+    from metavision_sdk_ui import BaseWindow, UIAction, UIKeyEvent, Window
+
     camera_dimensions = CameraDims(CAMERA_DIM_X, CAMERA_DIM_Y)
     filter_windows = FilterWindows(EBSNOR_TIME_WINDOW, EBSNOR_SPATIAL_WINDOW)
-    preprocessor = EBSnoRFilter(camera_dimensions, filter_windows)
-    iter_evts = EventsIterator(EVENTS_FILEPATH, delta_t=33333, relative_timestamps = False)
+    preprocessor = EBSnoRFilter(
+        camera_dimensions,
+        filter_windows,
+        EBSNOR_BACKEND,
+        num_workers=EBSNOR_NUM_WORKERS
+    )
+    iter_evts = EventChunkIterator(EVENTS_FILEPATH, delta_t=33333)
 
     with Window(
         title="EBSnoR example",
@@ -161,11 +62,14 @@ def main() -> None:
         event_frame_gen.set_output_callback(on_frame_cb)
 
         for evts in iter_evts:
-            processed = preprocessor.process(evts, adaptive_window=USE_ADAPTIVE_WIN)
+            processed = preprocessor.process_stream(evts, adaptive_window=USE_ADAPTIVE_WIN)
             event_frame_gen.process_events(processed)
 
             if viewer.should_close():
                 break
+        else:
+            event_frame_gen.process_events(preprocessor.flush())
+    preprocessor.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,158 @@
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import itertools
+import os
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+import numpy as np
+from numpy.typing import NDArray
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, PYTHON_DIR)
+sys.path.insert(0, os.path.join(PYTHON_DIR, "SimulationAnalysis"))
+from ebsnor_core import ( # pylint: disable=wrong-import-position
+    Backend,
+    CameraDims,
+    EBSnoRFilter,
+    FilterWindows
+)
+from eventsource import load_events # pylint: disable=wrong-import-position
+
+###############################################################################
+# Data paths, replace with corresponding paths on your system
+EVENTS_FILEPATH = ""                # Events filepath (.dat, .mat, .npy or .raw)
+GROUND_TRUTH_FILEPATH = ""          # Optional ground truth .npy (True for snow)
+RESULTS_SAVEFILE = "ebsnor_sweep.csv"
+###############################################################################
+
+###############################################################################
+# Settings, replace desired values
+CAMERA_DIM_X = 1280                 # Camera resolution width
+CAMERA_DIM_Y = 720                  # Camera resolution height
+IE_TIME_WINDOWS = [10000]           # IE filter time windows
+TIME_WINDOWS = [1000, 2500, 5000, 10000, 20000]
+SPATIAL_WINDOWS = [0, 1, 2, 3]
+ADAPTIVE_WINDOWS = [False, True]
+EBSNOR_BACKEND = "numba"            # EBSnoR filter backend ("python" or "numba")
+NUM_WORKERS = os.cpu_count() or 1   # Settings evaluated in parallel
+###############################################################################
+
+class SweepSetting(NamedTuple):
+    ie_time_window: int
+    time_window: int
+    spatial_window: int
+    adaptive_window: bool
+
+class SweepResult(NamedTuple):
+    ie_time_window: int
+    time_window: int
+    spatial_window: int
+    adaptive_window: bool
+    removed_fraction: float
+    precision: float                # nan without ground truth
+    recall: float                   # nan without ground truth
+
+def make_grid(
+    ie_time_windows: Iterable[int],
+    time_windows: Iterable[int],
+    spatial_windows: Iterable[int],
+    adaptive_windows: Iterable[bool]
+) -> List[SweepSetting]:
+    return [
+        SweepSetting(*setting)
+        for setting in itertools.product(
+            ie_time_windows, time_windows, spatial_windows, adaptive_windows)
+    ]
+
+class ParameterSweep:
+    """Evaluate EBSnoR settings on one recording.
+
+    The IE/TE labels only depend on the IE time window, so they are computed
+    once per IE time window and shared by every snow filter setting.
+    """
+    def __init__(
+        self,
+        events: Any,
+        dimensions: CameraDims,
+        ground_truth: NDArray[np.bool] | None = None,
+        backend: Backend | str = Backend.NUMBA,
+        num_workers: int = 1
+    ) -> None:
+        self.events = events
+        self.dimensions = dimensions
+        self.ground_truth = None if ground_truth is None else np.asarray(ground_truth, dtype=bool)
+        self.backend = backend
+        self.num_workers = num_workers
+        self._ie_cache: Dict[int, Tuple[NDArray[np.bool], NDArray[np.int32]]] = {}
+        self._lock = threading.Lock()
+
+    def ie_results(self, ie_time_window: int) -> Tuple[NDArray[np.bool], NDArray[np.int32]]:
+        with self._lock:
+            cached = self._ie_cache.get(ie_time_window)
+        if cached is None:
+            ebsnor = EBSnoRFilter(self.dimensions, FilterWindows(ie_time_window, 0), self.backend)
+            cached = ebsnor.ie_filter(self.events, ie_time_window, EBSnoRFilter.TE_DEPTH)
+            with self._lock:
+                cached = self._ie_cache.setdefault(ie_time_window, cached)
+        return cached
+
+    def evaluate(self, setting: SweepSetting) -> SweepResult:
+        is_ie, te_next = self.ie_results(setting.ie_time_window)
+        windows = FilterWindows(setting.time_window, setting.spatial_window)
+        ebsnor = EBSnoRFilter(self.dimensions, windows, self.backend)
+        is_snow = ebsnor.ebsnor_filter(self.events, is_ie, te_next, setting.adaptive_window)
+
+        precision = recall = np.nan
+        if self.ground_truth is not None:
+            true_pos = np.count_nonzero(is_snow & self.ground_truth)
+            if np.any(is_snow):
+                precision = true_pos / np.count_nonzero(is_snow)
+            if np.any(self.ground_truth):
+                recall = true_pos / np.count_nonzero(self.ground_truth)
+        removed = np.count_nonzero(is_snow) / len(is_snow) if len(is_snow) > 0 else 0.0
+        return SweepResult(*setting, removed, precision, recall)
+
+    def run(self, settings: Iterable[SweepSetting]) -> List[SweepResult]:
+        settings = list(settings)
+        with ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+            # Fill the IE cache first so no two workers compute the same labels
+            ie_windows = sorted({setting.ie_time_window for setting in settings})
+            list(pool.map(self.ie_results, ie_windows))
+            return list(pool.map(self.evaluate, settings))
+
+def write_results(fname: str, results: List[SweepResult]) -> None:
+    with open(fname, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(SweepResult._fields)
+        writer.writerows(results)
+
+def format_results(results: List[SweepResult]) -> str:
+    lines = ["IE win | Time win | Spatial win | Adaptive | Removed | Precision | Recall"]
+    for res in results:
+        lines.append(
+            f"{res.ie_time_window:>6} | {res.time_window:>8} | {res.spatial_window:>11} | "
+            f"{str(res.adaptive_window):>8} | {res.removed_fraction:>7.2%} | "
+            f"{res.precision:>9.4f} | {res.recall:>6.4f}"
+        )
+    return "\n".join(lines)
+
+def main() -> None:
+    events = load_events(EVENTS_FILEPATH)
+    ground_truth = np.load(GROUND_TRUTH_FILEPATH) if GROUND_TRUTH_FILEPATH else None
+
+    sweep = ParameterSweep(
+        events,
+        CameraDims(CAMERA_DIM_X, CAMERA_DIM_Y),
+        ground_truth,
+        EBSNOR_BACKEND,
+        NUM_WORKERS
+    )
+    grid = make_grid(IE_TIME_WINDOWS, TIME_WINDOWS, SPATIAL_WINDOWS, ADAPTIVE_WINDOWS)
+    results = sweep.run(grid)
+    write_results(RESULTS_SAVEFILE, results)
+    print(format_results(results))
+    print(f"Results saved to {RESULTS_SAVEFILE}")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,15 @@
 from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 import os
-from typing import List, NamedTuple, Optional, Tuple
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 import csv
 import cv2
 
+from file_comparison import BINARY_EXTENSIONS, read_binfile
+
 ###############################################################################
 # Data paths, replace with corresponding paths on your system
 DETECTIONS_SNOW_CSV: str = ""       # Detections w/ snow CSV filepath
@@ -19,6 +23,7 @@ SAVE_DIR: str = ""                  # Annotated frames save directory path
 # Settings, replace desired values
 LABEL_WINDOW: int = 0               # Labels time window (+/- value)
 DETECTION_WINDOW: int = 50000       # Detections time window (+/- value)
+NUM_WORKERS: int = os.cpu_count() or 1  # Processes used to annotate frames
 ###############################################################################
 
 @dataclass(init=False, frozen=True)
@@ -27,6 +32,8 @@ class BoxColors:
     GREEN: Tuple[float, float, float] = (0.0, 255.0, 0.0)
     RED: Tuple[float, float, float] = (0.0, 0.0, 255.0)
 
+Rectangle = Tuple[Tuple[int, int], Tuple[int, int], Tuple[float, float, float]]
+
 class BoundingBox(NamedTuple):
     timestamp: int
     xcoord: int
@@ -53,6 +60,8 @@ class BoundingBox(NamedTuple):
         )
 
 def read_csvfile(csvpath: str, is_label: bool = False) -> List[BoundingBox]:
+    if os.path.splitext(csvpath)[1] in BINARY_EXTENSIONS:
+        return [BoundingBox(*box) for box in read_binfile(csvpath)]
     data = []
     with open(csvpath, "r") as csvfile:
         reader = csv.reader(csvfile, delimiter=" ")
@@ -60,13 +69,70 @@ def read_csvfile(csvpath: str, is_label: bool = False) -> List[BoundingBox]:
             data.append(BoundingBox.from_csv_data(row, is_label))
     return data
 
-def get_image_filename(imgs: List[str], timestamp: int, win: int) -> Optional[str]:
-    segment_lower = f"_{timestamp - win}"
-    segment_upper = f"_{timestamp + win}"
-    for img in imgs:
-        if segment_lower in img or segment_upper in img:
-            return img
-    return None
+def build_image_index(imgs: List[str]) -> Dict[int, int]:
+    # Timestamp -> position of the first image whose name contains "_<timestamp>"
+    index: Dict[int, int] = {}
+    for pos, img in enumerate(imgs):
+        for match in re.finditer(r"_(\d+)", img):
+            index.setdefault(int(match.group(1)), pos)
+    return index
+
+def get_image_filename(
+    imgs: List[str],
+    index: Dict[int, int],
+    timestamp: int,
+    win: int
+) -> Optional[str]:
+    positions = [
+        index[ts] for ts in (timestamp - win, timestamp + win) if ts in index
+    ]
+    return imgs[min(positions)] if positions else None
+
+def group_boxes(
+    box_sets: List[Tuple[List[BoundingBox], int, Tuple[float, float, float]]],
+    imgs: List[str]
+) -> Dict[str, List[Rectangle]]:
+    # Image filename -> rectangles to draw on it, in the order they were given
+    index = build_image_index(imgs)
+    frames: Dict[str, List[Rectangle]] = {}
+    for boxes, window, color in box_sets:
+        for box in boxes:
+            imgfile = get_image_filename(imgs, index, box.timestamp, window)
+            if imgfile is None:
+                continue
+            pt1 = (box.xcoord, box.ycoord)
+            pt2 = (box.xcoord + box.width, box.ycoord + box.height)
+            frames.setdefault(imgfile, []).append((pt1, pt2, color))
+    return frames
+
+def annotate_frame(imgpath: str, savepath: str, rects: List[Rectangle]) -> None:
+    if os.path.isfile(savepath):
+        imgpath = savepath
+    img = cv2.imread(imgpath)
+    if img is None:
+        return
+    for pt1, pt2, color in rects:
+        cv2.rectangle(img, pt1, pt2, color, thickness=2)
+    cv2.imwrite(savepath, img)
+
+def draw_frames(
+    frames: Dict[str, List[Rectangle]],
+    imgdir: str,
+    savedir: str,
+    num_workers: int = NUM_WORKERS
+) -> None:
+    imgpaths = [os.path.join(imgdir, imgfile) for imgfile in frames]
+    savepaths = [os.path.join(savedir, imgfile) for imgfile in frames]
+    if num_workers <= 1:
+        for args in zip(imgpaths, savepaths, frames.values()):
+            annotate_frame(*args)
+        return
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        chunksize = max(1, len(frames) // (4 * num_workers))
+        for _ in pool.map(
+            annotate_frame, imgpaths, savepaths, frames.values(), chunksize=chunksize
+        ):
+            pass
 
 def draw_boxes(
     boxes: List[BoundingBox],
@@ -75,30 +141,23 @@ def draw_boxes(
     window: int,
     color: Tuple[float, float, float]
 ) -> None:
-    imglist = os.listdir(imgdir)
-    for box in boxes:
-        imgfile = get_image_filename(imglist, box.timestamp, window)
-        if imgfile is None:
-            continue
-        imgpath = os.path.join(imgdir, imgfile)
-        savepath = os.path.join(savedir, imgfile)
-        if os.path.isfile(savepath):
-            imgpath = savepath
-        img = cv2.imread(imgpath)
-        if img is not None:
-            pt1 = (box.xcoord, box.ycoord)
-            pt2 = (box.xcoord + box.width, box.ycoord + box.height)
-            cv2.rectangle(img, pt1, pt2, color, thickness=2)
-            cv2.imwrite(savepath, img)
+    frames = group_boxes([(boxes, window, color)], os.listdir(imgdir))
+    draw_frames(frames, imgdir, savedir)
 
 def main() -> None:
     detections_snow = read_csvfile(DETECTIONS_SNOW_CSV)
     detections_nosnow = read_csvfile(DETECTIONS_NOSNOW_CSV)
     labels = read_csvfile(BOUNDING_BOX_LABELS_CSV, is_label=True)
 
-    draw_boxes(labels, IMAGE_DIR, SAVE_DIR, LABEL_WINDOW, BoxColors.BLUE)
-    draw_boxes(detections_snow, IMAGE_DIR, SAVE_DIR, DETECTION_WINDOW, BoxColors.GREEN)
-    draw_boxes(detections_nosnow, IMAGE_DIR, SAVE_DIR, DETECTION_WINDOW, BoxColors.RED)
+    frames = group_boxes(
+        [
+            (labels, LABEL_WINDOW, BoxColors.BLUE),
+            (detections_snow, DETECTION_WINDOW, BoxColors.GREEN),
+            (detections_nosnow, DETECTION_WINDOW, BoxColors.RED)
+        ],
+        os.listdir(IMAGE_DIR)
+    )
+    draw_frames(frames, IMAGE_DIR, SAVE_DIR, NUM_WORKERS)
 
 if __name__ == "__main__":
     main()
@@ -1,34 +1,34 @@
 import csv
 from enum import Enum
 import os
-from typing import Any, NamedTuple, Tuple
+import queue
+import sys
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Tuple
 import numpy as np
-from numpy.typing import NDArray
-import torch
-from metavision_sdk_ml import EventBbox
-from metavision.core.event_io import EventsIterator
-from metavision_ml.detection_tracking import ObjectDetector
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, PYTHON_DIR)
+sys.path.insert(0, os.path.join(PYTHON_DIR, "SimulationAnalysis"))
+from ebsnor_core import Backend, CameraDims, EBSnoRFilter, FilterWindows # pylint: disable=wrong-import-position
+from eventcache import EventCache # pylint: disable=wrong-import-position
+from events import EVENT2D_DTYPE # pylint: disable=wrong-import-position
+from eventsource import EventChunkIterator # pylint: disable=wrong-import-position
+from file_comparison import BINARY_EXTENSIONS # pylint: disable=wrong-import-position
 
 MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Models")
 RED_EVENT_CUBE_PATH = os.path.join(MODELS_DIR, "red_event_cube_05_2020")
 RED_HISTOGRAM_PATH = os.path.join(MODELS_DIR, "red_histogram_05_2020")
 
-class CameraDims(NamedTuple):
-    width: int
-    height: int
-
-class FilterWindows(NamedTuple):
-    time_win: int
-    spatial_win: int
-
 class CNNType(Enum):
     RED_EVENT_CUBE = RED_EVENT_CUBE_PATH
     RED_HISTOGRAM = RED_HISTOGRAM_PATH
 
 ###############################################################################
 # Data paths, replace with corresponding paths on your system
-EVENTS_FILEPATH = ""                # Raw events filepath
-OUTPUT_CSVPATH = ""                 # Results CSV filepath
+EVENTS_FILEPATH = ""                # Events filepath (.raw, .dat, .mat or .npy)
+OUTPUT_CSVPATH = ""                 # Results filepath (.csv, or .npy/.npz for binary)
 ###############################################################################
 
 ###############################################################################
@@ -40,14 +40,121 @@ EBSNOR_SPATIAL_WINDOW = 0           # EBSnoR filter spatial window
 EBSNOR_TIME_WINDOW = 10000          # EBSnoR filter time window
 CNN_MODEL = CNNType.RED_EVENT_CUBE  # CNN model
 USE_ADAPTIVE_WIN = False            # Enable/Disable EBSnoR adaptive window
+EBSNOR_BACKEND = Backend.NUMBA      # EBSnoR filter backend
+EBSNOR_NUM_WORKERS = 1              # EBSnoR filter threads (one sensor tile each)
+PIPELINE_QUEUE_SIZE = 8             # Max slices waiting between pipeline stages
+USE_EVENT_CACHE = False             # Reuse decoded events and EBSnoR labels between runs
 ###############################################################################
 
 
+class StageStats:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.count: int = 0
+        self.total_time: float = 0
+        self.max_time: float = 0
+        self.queue_depth: int = 0
+        self.max_queue_depth: int = 0
+
+    def record(self, elapsed: float, queue_depth: int) -> None:
+        self.count += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.queue_depth = queue_depth
+        self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+
+    def mean_time(self) -> float:
+        return self.total_time / self.count if self.count > 0 else 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.count} slices, "
+            f"mean {self.mean_time() * 1e3:.2f} ms, max {self.max_time * 1e3:.2f} ms, "
+            f"max input queue depth {self.max_queue_depth}"
+        )
+
+class _PipelineError(NamedTuple):
+    error: BaseException
+
+_PIPELINE_DONE = object()
+
+def run_pipeline(
+    source: Iterable[Any],
+    stages: List[Tuple[str, Callable[[Any], Any]]],
+    queue_size: int = PIPELINE_QUEUE_SIZE
+) -> List[StageStats]:
+    # The source and every stage but the last run in their own thread, joined
+    # by bounded FIFO queues. Each stage handles items in arrival order, so the
+    # output order matches the source order. A full queue blocks its producer.
+    stats = [StageStats("source")] + [StageStats(name) for name, _ in stages]
+    queues: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in stages]
+
+    def produce() -> None:
+        items: Iterator[Any] = iter(source)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                stats[0].record(time.perf_counter() - start, 0)
+                queues[0].put(item)
+        except BaseException as error: # pylint: disable=broad-except
+            queues[0].put(_PipelineError(error))
+            return
+        queues[0].put(_PIPELINE_DONE)
+
+    def consume(idx: int) -> None:
+        # Errors are passed downstream and raised by the last stage, in the caller's thread
+        _, func = stages[idx]
+        is_last = idx + 1 == len(stages)
+        while True:
+            depth = queues[idx].qsize()
+            item = queues[idx].get()
+            if isinstance(item, _PipelineError) and is_last:
+                raise item.error
+            if item is _PIPELINE_DONE or isinstance(item, _PipelineError):
+                if not is_last:
+                    queues[idx + 1].put(item)
+                return
+            start = time.perf_counter()
+            try:
+                result = func(item)
+            except BaseException as error: # pylint: disable=broad-except
+                if is_last:
+                    raise
+                queues[idx + 1].put(_PipelineError(error))
+                return
+            stats[idx + 1].record(time.perf_counter() - start, depth)
+            if not is_last:
+                queues[idx + 1].put(result)
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    threads += [
+        threading.Thread(target=consume, args=(idx,), daemon=True)
+        for idx in range(len(stages) - 1)
+    ]
+    for thread in threads:
+        thread.start()
+    consume(len(stages) - 1)
+    for thread in threads:
+        thread.join()
+    return stats
+
 class DetectionCNN:
     DOWNSCALE_FACTOR = 2
     DETECTOR_SCORE_THRESHOLD = 0.4
     IOU_THRESHOLD = 0.4
+    # EventBbox field positions in CSV column order:
+    # timestamp, class_id, track_id, x, y, width, height, confidence
+    CSV_FIELDS = (0, 5, 6, 1, 2, 3, 4, 7)
     def __init__(self, dimensions: CameraDims, model: CNNType, output_csv: str) -> None:
+        # torch and the Metavision SDK are only needed once a detector is created
+        # pylint: disable=import-outside-toplevel
+        import torch
+        from metavision_ml.detection_tracking import ObjectDetector
+
         detector = ObjectDetector(
             model.value,
             events_input_width=dimensions.width,
@@ -69,18 +176,25 @@ class DetectionCNN:
         cd_processor = detector.get_cd_processor()
         frame_buffer = cd_processor.init_output_tensor()
         accumulation_time = detector.get_accumulation_time()
-        csvfile = open(output_csv, "w", newline="")
-        csvwriter = csv.writer(csvfile, delimiter=" ")
+        binary_output = os.path.splitext(output_csv)[1] in BINARY_EXTENSIONS
+        csvfile = None if binary_output else open(output_csv, "w", newline="")
+        csvwriter = None if csvfile is None else csv.writer(csvfile, delimiter=" ")
 
 
         self.accumulation_time = accumulation_time
         self.cd_processor = cd_processor
         self.detector = detector
         self.frame_buffer = frame_buffer
+        self.output_path = output_csv
+        self.binary_output = binary_output
+        self.binary_chunks: List[Any] = []
         self.csvfile = csvfile
         self.csvwriter = csvwriter
 
     def run(self, events: Any, timestamp: Any) -> None:
+        import torch # pylint: disable=import-outside-toplevel
+        from metavision_sdk_ml import EventBbox # pylint: disable=import-outside-toplevel
+
         start_ts = torch.div(timestamp - 1, self.accumulation_time, rounding_mode="floor")
         start_ts *= self.accumulation_time
         self.cd_processor.process_events(start_ts, events, self.frame_buffer)
@@ -90,141 +204,105 @@ class DetectionCNN:
             detections = self.detector.process(timestamp, self.frame_buffer)
             self.frame_buffer.fill(0)
 
-        for detection in detections:
-            self._write_row_to_csv(detection)
-
-    def _write_row_to_csv(self, detection: Any) -> None:
-        timestamp = detection[0]
-        xcoord = detection[1]
-        ycoord = detection[2]
-        width = detection[3]
-        height = detection[4]
-        class_id = detection[5]
-        track_id = detection[6]
-        confidence = detection[7]
-
-        row = (timestamp, class_id, track_id, xcoord, ycoord, width, height, confidence)
-        self.csvwriter.writerow(row)
-
-class EBSnoRFilter:
-    def __init__(self, dimensions: CameraDims, windows: FilterWindows) -> None:
-        self.time_window = windows.time_win
-        self.spatial_window = windows.spatial_win
-        self.cam_x = dimensions.width
-        self.cam_y = dimensions.height
-
-    def ie_filter(
-        self,
-        events: Any,
-        time_window: int = 10000,
-        te_depth: int = 10
-    ) -> Tuple[NDArray[np.bool], NDArray[np.uint64]]:
-        datalen = len(events["t"])
-        ie_idx = np.zeros((self.cam_x, self.cam_y), dtype=int)
-        prev_ts = np.zeros((self.cam_x, self.cam_y), dtype=int)
-        prev_p = np.zeros((self.cam_x, self.cam_y), dtype=int)
-
-        is_ie = np.zeros(datalen, dtype=bool)
-        te_data = -1*np.ones((datalen, te_depth), dtype=int)
-        te_idx = np.zeros(datalen, dtype=int)
-
-        iter_ev = zip(events["x"], events["y"], events["p"], events["t"])
-        for idx, (xval, yval, pval, tval) in enumerate(iter_ev):
-            if pval != prev_p[xval][yval] or tval - prev_ts[xval][yval] > time_window:
-                is_ie[idx] = True
-                ie_idx[xval][yval] = idx
-            else:
-                if te_idx[ie_idx[xval][yval]] > te_depth:
-                    continue
-                te_data[ie_idx[xval][yval]][te_idx[xval][yval]] = idx
-                te_idx[ie_idx[xval][yval]] += 1
-            prev_ts[xval][yval] = tval
-            prev_p[xval][yval] = pval
-
-        return is_ie, te_data
-
-    def ebsnor_filter(
-        self,
-        events: Any,
-        is_ie: NDArray[np.bool],
-        te_data: NDArray[np.uint64],
-        adaptive_window: bool = False
-    ) -> NDArray[np.bool]:
-        datalen = len(events["t"])
-        events["x"] += self.spatial_window
-        events["y"] += self.spatial_window
-        pos_ts = -np.inf * np.ones(
-            (self.cam_x + 2 * self.spatial_window, self.cam_y + 2 * self.spatial_window),
-            dtype=int
-        )
-        pos_idx = np.zeros(
-            (self.cam_x + 2 * self.spatial_window, self.cam_y + 2 * self.spatial_window),
-            dtype=int
-        )
-        win = np.arange(-self.spatial_window, self.spatial_window + 1, dtype=int)
-        is_snow = np.zeros(datalen, dtype=bool)
-
-        iter_ev = zip(events["x"], events["y"], events["p"], events["t"])
-        for idx, (xval, yval, pval, tval) in enumerate(iter_ev):
-            if is_ie[idx] and pval < 0:
-                in_range = False
-                if adaptive_window:
-                    in_range = tval - pos_ts[xval][yval] < self.time_window
-                    positions = pos_idx[xval][yval]
-                if not in_range:
-                    in_range = np.less(tval - pos_ts[xval + win][yval + win], self.time_window)
-                    positions = pos_idx[xval + win][yval + win]
-                if in_range.any():
-                    is_snow[idx] = True
-                    te_idx = te_data[idx]
-                    is_snow[te_idx[te_idx > -1]] = True
-                    is_snow[positions[in_range]] = True # type: ignore
-                    te_idx = te_data[positions[in_range]] # type: ignore
-                    is_snow[te_idx[te_idx > 0]] = True
-            elif is_ie[idx]:
-                pos_idx[xval][yval] = idx
-                pos_ts[xval][yval] = idx
-
-        return is_snow
-
-    def process(self, events: Any, adaptive_window: bool = False) -> Any:
-        is_ie, te_data = self.ie_filter(events)
-        is_snow = self.ebsnor_filter(events, is_ie, te_data, adaptive_window)
-
-        new_length = len(events["t"]) - np.count_nonzero(is_snow)
-        new_x = events["x"][np.logical_not(is_snow)]
-        new_y = events["y"][np.logical_not(is_snow)]
-        new_t = events["t"][np.logical_not(is_snow)]
-        new_p = events["p"][np.logical_not(is_snow)]
-
-        events = np.resize(events, new_length)
-        events["x"] = new_x
-        events["y"] = new_y
-        events["t"] = new_t
-        events["p"] = new_p
-
-        return events
+        if len(detections) > 0:
+            self._write_detections(detections)
+
+    def close(self) -> None:
+        from metavision_sdk_ml import EventBbox # pylint: disable=import-outside-toplevel
+
+        if not self.binary_output:
+            self.csvfile.close() # type: ignore
+            return
+        detections = np.concatenate(self.binary_chunks) \
+            if self.binary_chunks else np.empty(0, dtype=EventBbox)
+        if self.output_path.endswith(".npz"):
+            np.savez(self.output_path, detections=detections)
+        else:
+            np.save(self.output_path, detections)
+
+    def _write_detections(self, detections: Any) -> None:
+        # One write per accumulation window; the detector may reuse its output buffer
+        if self.binary_output:
+            self.binary_chunks.append(detections.copy())
+            return
+        # Cast to str by numpy, which formats float32 like the per-row writer did (10.3,
+        # not the 10.300000190734863 of a Python float)
+        names = detections.dtype.names
+        columns = [detections[names[idx]].astype(str).tolist() for idx in self.CSV_FIELDS]
+        self.csvwriter.writerows(zip(*columns)) # type: ignore
 
 
 def main() -> None:
     camera_dimensions = CameraDims(CAMERA_DIM_X, CAMERA_DIM_Y)
     filter_windows = FilterWindows(EBSNOR_TIME_WINDOW, EBSNOR_SPATIAL_WINDOW)
-    preprocessor = EBSnoRFilter(camera_dimensions, filter_windows)
-    cnn = DetectionCNN(camera_dimensions, CNN_MODEL, OUTPUT_CSVPATH)
-    iter_evts = EventsIterator(
-        EVENTS_FILEPATH,
-        start_ts=0,
-        delta_t=DELTA_T,
-        relative_timestamps=False
+    preprocessor = EBSnoRFilter(
+        camera_dimensions,
+        filter_windows,
+        EBSNOR_BACKEND,
+        num_workers=EBSNOR_NUM_WORKERS
     )
+    cnn = DetectionCNN(camera_dimensions, CNN_MODEL, OUTPUT_CSVPATH)
+    events_path = EVENTS_FILEPATH
+    cached_snow = None
+    # Streamed events are final time_window after they arrive, so slices reach
+    # the detector that many whole slices later
+    lag = -(-EBSNOR_TIME_WINDOW // DELTA_T) * DELTA_T
+    if USE_EVENT_CACHE:
+        # Labels of the whole recording, the same as streaming it
+        cache = EventCache()
+        cached_snow = cache.snow_labels(EVENTS_FILEPATH, preprocessor, USE_ADAPTIVE_WIN)[1]
+        events_path = cache.path(EVENTS_FILEPATH)
+        lag = 0
+    iter_evts = EventChunkIterator(events_path, delta_t=DELTA_T, start_ts=0)
+
+    def read_slices() -> Iterator[Tuple[Any, int]]:
+        # Slices may be views into the read buffer, so each one is copied before queueing
+        timestamp = 0
+        for evts in iter_evts:
+            timestamp = iter_evts.get_current_time()
+            yield evts.copy(), timestamp
+        # Empty slices past the end release the events the stream still holds
+        for _ in range(lag // DELTA_T):
+            timestamp += DELTA_T
+            yield np.empty(0, dtype=EVENT2D_DTYPE), timestamp
 
-    idx = 0
-    for evts in iter_evts:
-        timestamp = iter_evts.get_current_time()
-        processed = preprocessor.process(evts, USE_ADAPTIVE_WIN)
+    mask_offs = 0
+    pending = np.empty(0, dtype=EVENT2D_DTYPE)
+    def filter_slice(item: Tuple[Any, int]) -> Tuple[Any, int] | None:
+        nonlocal mask_offs, pending
+        evts, timestamp = item
+        if cached_snow is not None:
+            is_snow = cached_snow[mask_offs:mask_offs + len(evts)]
+            mask_offs += len(evts)
+            return evts[np.logical_not(is_snow)], timestamp
+        processed = preprocessor.process_stream(evts, USE_ADAPTIVE_WIN, current_time=timestamp)
+        pending = np.concatenate((pending, processed))
+        slice_end = timestamp - lag
+        if slice_end <= 0:
+            return None
+        split = int(np.searchsorted(pending["t"], slice_end))
+        processed, pending = pending[:split], pending[split:]
+        return processed, slice_end
+
+    iteration = 0
+    def detect_slice(item: Tuple[Any, int] | None) -> None:
+        nonlocal iteration
+        if item is None:
+            return
+        processed, timestamp = item
         cnn.run(processed, timestamp)
-        print(f"Iteration{idx} done. Timestamp={timestamp - DELTA_T}")
-        idx += 1
+        print(f"Iteration{iteration} done. Timestamp={timestamp - DELTA_T}")
+        iteration += 1
+
+    stats = run_pipeline(
+        read_slices(),
+        [("ebsnor", filter_slice), ("detection", detect_slice)],
+        PIPELINE_QUEUE_SIZE
+    )
+    cnn.close()
+    preprocessor.close()
+    for stage in stats:
+        print(stage)
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,9 @@
 from __future__ import annotations
 import csv
+import os
 from typing import List, NamedTuple, Tuple
+import numpy as np
+from numpy.typing import NDArray
 
 ###############################################################################
 # Data paths, replace with corresponding paths on your system
@@ -18,6 +21,8 @@ TIME_PER_FRAME = 50000              # Frame duration in uS
 SECONDS_IN_VIDEO = 153              # Total number of sequence in video
 ###############################################################################
 
+BINARY_EXTENSIONS = (".npy", ".npz")    # Binary detection files written by DetectionCNN
+
 class AnalysisResults:
     def __init__(self, num_labels: int) -> None:
         self.num_labels: int = num_labels
@@ -63,7 +68,51 @@ class BoundingBox(NamedTuple):
             height=round(float(data[6]))
         )
 
+class BoxArrays(NamedTuple):
+    # Boxes sorted by timestamp, `order` holds each box's position in the file
+    timestamp: NDArray[np.int64]
+    xcoord: NDArray[np.int64]
+    ycoord: NDArray[np.int64]
+    width: NDArray[np.int64]
+    height: NDArray[np.int64]
+    order: NDArray[np.int64]
+
+    @staticmethod
+    def from_boxes(boxes: List[BoundingBox]) -> BoxArrays:
+        data = np.array(boxes, dtype=np.int64).reshape(-1, len(BoundingBox._fields))
+        order = np.argsort(data[:, 0], kind="stable")
+        data = data[order]
+        return BoxArrays(
+            timestamp=data[:, 0],
+            xcoord=data[:, 1],
+            ycoord=data[:, 2],
+            width=data[:, 3],
+            height=data[:, 4],
+            order=order
+        )
+
+    def window(self, lower: float, upper: float) -> BoxArrays:
+        # Boxes with lower <= timestamp < upper, in file order
+        first, last = np.searchsorted(self.timestamp, (lower, upper), side="left")
+        sel = first + np.argsort(self.order[first:last], kind="stable")
+        return BoxArrays(*(field[sel] for field in self))
+
+def read_binfile(binpath: str) -> List[BoundingBox]:
+    # EventBbox records saved by DetectionCNN: t, x, y, w, h, ... by position
+    if binpath.endswith(".npz"):
+        with np.load(binpath) as bindata:
+            data = bindata["detections"]
+    else:
+        data = np.load(binpath)
+    names = data.dtype.names
+    cols = [np.round(data[names[idx]].astype(np.float64)).astype(np.int64) for idx in range(5)]
+    cols[1] = np.maximum(cols[1], 0)
+    cols[2] = np.maximum(cols[2], 0)
+    return [BoundingBox(*row) for row in zip(*(col.tolist() for col in cols))]
+
 def read_csvfile(csvpath: str, is_label: bool = False) -> List[BoundingBox]:
+    if os.path.splitext(csvpath)[1] in BINARY_EXTENSIONS:
+        return read_binfile(csvpath)
     data = []
     with open(csvpath, "r") as csvfile:
         reader = csv.reader(csvfile, delimiter=" ")
@@ -71,56 +120,57 @@ def read_csvfile(csvpath: str, is_label: bool = False) -> List[BoundingBox]:
             data.append(BoundingBox.from_csv_data(row, is_label))
     return data
 
-def calculate_intersection(box1: BoundingBox, box2: BoundingBox) -> int:
-    val_x0 = max(box1.xcoord, box2.xcoord)
-    val_x1 = min(box1.xcoord + box1.width, box2.xcoord + box2.width)
-    val_y0 = max(box1.ycoord, box2.ycoord)
-    val_y1 = min(box1.ycoord + box1.height, box2.ycoord + box2.height)
-
-    return max(0, val_x1 - val_x0) * max(0, val_y1 - val_y0)
-
-def calculate_union(box1: BoundingBox, box2: BoundingBox, intersection: int) -> int:
-    box1_area = box1.width * box1.height
-    box2_area = box2.width * box2.height
-
-    return (box1_area + box2_area) - intersection
-
-def calculate_metrics(detection: BoundingBox, label: BoundingBox) -> Tuple[float, float]:
-    intersection = calculate_intersection(detection, label)
-    union = calculate_union(detection, label, intersection)
-
-    percent_overlap = intersection / (label.width * label.height)
-    intersection_over_union = intersection / union
+def calculate_metrics_matrix(
+    detections: BoxArrays,
+    labels: BoxArrays
+) -> Tuple[NDArray[np.float64], NDArray[np.float64]]:
+    # Percent overlap and IOU of every detection (rows) against every label (columns)
+    det = [field[:, np.newaxis] for field in detections[1:5]]
+    lbl = [field[np.newaxis, :] for field in labels[1:5]]
+    val_x0 = np.maximum(det[0], lbl[0])
+    val_x1 = np.minimum(det[0] + det[2], lbl[0] + lbl[2])
+    val_y0 = np.maximum(det[1], lbl[1])
+    val_y1 = np.minimum(det[1] + det[3], lbl[1] + lbl[3])
+    intersection = np.maximum(0, val_x1 - val_x0) * np.maximum(0, val_y1 - val_y0)
+    label_area = lbl[2] * lbl[3]
+    union = (det[2] * det[3] + label_area) - intersection
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent_overlap = intersection / label_area
+        intersection_over_union = intersection / union
 
     return percent_overlap, intersection_over_union
 
 def analyze_frame_set(
     frame_window: int,
-    detections: List[BoundingBox],
-    labels: List[BoundingBox],
+    detections: BoxArrays,
+    labels: BoxArrays,
     total_seconds: int,
     threshold: int
 ) -> AnalysisResults:
-    results = AnalysisResults(len(labels))
+    results = AnalysisResults(len(labels.timestamp))
     for second in range(total_seconds + 1):
         lims = ((second * 1e6) - frame_window, (second * 1e6) + frame_window)
-        frame_detections = [x for x in detections if lims[0] <= x.timestamp < lims[1]]
-        frame_labels = [x for x in labels if lims[0] <= x.timestamp < lims[1]]
-        matched = [False for _ in labels]
-        for detection in frame_detections:
-            valid = False
-            for idx, label in enumerate(frame_labels):
-                percent_overlap, iou = calculate_metrics(detection, label)
-                if iou > threshold:
-                    valid = True
-                    if not matched[idx]:
-                        matched[idx] = True
-                        results.true_positive += 1
-                        results.running_percent_overlap += percent_overlap
-                        results.running_iou += iou
-                    break
-            if not valid:
-                results.false_positive += 1
+        frame_detections = detections.window(*lims)
+        frame_labels = labels.window(*lims)
+        if len(frame_labels.timestamp) == 0:
+            results.false_positive += len(frame_detections.timestamp)
+            continue
+        percent_overlap, iou = calculate_metrics_matrix(frame_detections, frame_labels)
+
+        # Each detection is checked against its first label above the threshold.
+        # Only the first detection to reach a given label counts as a true positive.
+        above = iou > threshold
+        valid = above.any(axis=1)
+        first_label = np.argmax(above, axis=1)
+        matched_label, matched_det = np.unique(first_label[valid], return_index=True)
+        matched_det = np.flatnonzero(valid)[matched_det]
+
+        results.true_positive += len(matched_label)
+        results.false_positive += int(np.count_nonzero(np.logical_not(valid)))
+        results.running_percent_overlap += float(
+            np.sum(percent_overlap[matched_det, matched_label]))
+        results.running_iou += float(np.sum(iou[matched_det, matched_label]))
 
     return results
 
@@ -156,6 +206,9 @@ def main() -> None:
     detections_snow = read_csvfile(DETECTIONS_SNOW_CSV)
     detections_nosnow = read_csvfile(DETECTIONS_NOSNOW_CSV)
     labels = read_csvfile(BOUNDING_BOX_LABELS_CSV, is_label=True)
+    detections_snow = BoxArrays.from_boxes(detections_snow)
+    detections_nosnow = BoxArrays.from_boxes(detections_nosnow)
+    labels = BoxArrays.from_boxes(labels)
     for num_frames in range(1, FRAMES + 1):
         results_snow = analyze_frame_set(
             num_frames * TIME_PER_FRAME,
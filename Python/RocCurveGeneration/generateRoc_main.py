@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 import os
+import sys
 import h5py
 import matplotlib.pyplot as plt
 import numpy as np
@@ -8,6 +9,7 @@ import numpy as np
 # FILENAMES
 #--------------------------------------------------------------------
 TIMEWIDTHS_FPATH = os.path.join("data", "tWidths_{}mph.mat")
+EVENTS_FPATH = os.path.join("data", "merged_snowEvents_{}mph.dat")
 
 #--------------------------------------------------------------------
 # GENERATION SETTINGS
@@ -18,6 +20,13 @@ GEN_SPATIAL_WINDOW = True
 GEN_PER_PIXEL = True
 GEN_ADAPTIVE_WINDOW = True
 RESULTS_PRINT_IDX = [8, 10, 1, 2, 9]
+COMPUTE_TIMEWIDTHS = False      # Compute from EVENTS_FPATH instead of reading TIMEWIDTHS_FPATH
+CAMERA_DIM_X = 1280
+CAMERA_DIM_Y = 720
+EBSNOR_SPATIAL_WINDOW = 2
+EBSNOR_TIME_WINDOW = 10000      # Same-pixel range of the adaptive window
+EBSNOR_BACKEND = "numba"
+USE_EVENT_CACHE = False         # Reuse computed time widths (see SimulationAnalysis/eventcache.py)
 
 #--------------------------------------------------------------------
 # TIME WINDOW SETTINGS
@@ -30,22 +39,31 @@ ETAS = [
     5000, 7500, 10000, 50000, 100000
 ]
 
+#--------------------------------------------------------------------
+# ROC SWEEP SETTINGS
+#--------------------------------------------------------------------
+ROC_MIN_ETA = 1
+ROC_MAX_ETA = 1e6
+ROC_NUM_ETAS = 5000
+
 @dataclass
 class ResultsStruct:
-    precision: float
-    recall: float
-    accuracy: float
-    tp_rate: float
-    fp_rate: float
-    tn_rate: float
-    fn_rate: float
+    etas: np.ndarray
+    precision: np.ndarray
+    recall: np.ndarray
+    accuracy: np.ndarray
+    tp_rate: np.ndarray
+    fp_rate: np.ndarray
+    tn_rate: np.ndarray
+    fn_rate: np.ndarray
+    auc: float
 
 @dataclass
 class PredictionData:
-    tp: list[int | float] | int | float
-    fp: list[int | float] | int | float
-    tn: list[int | float] | int | float
-    fn: list[int | float] | int | float
+    tp: np.ndarray
+    fp: np.ndarray
+    tn: np.ndarray
+    fn: np.ndarray
     gt_snow: int
     gt_nosnow: int
 
@@ -74,40 +92,69 @@ def get_timewidths(fname: str) -> np.ndarray:
     }
     return ground_truth, data
 
-def get_tp_fp_tn_fn(data: PredictionData, pred, ground_truth) -> PredictionData:
-    data.tp.append(
-        np.count_nonzero(np.logical_and(ground_truth, pred))),
-    data.fp.append(
-        np.count_nonzero(np.logical_and(np.logical_not(ground_truth), pred))),
-    data.tn.append(
-        np.count_nonzero(np.logical_and(np.logical_not(ground_truth), np.logical_not(pred)))),
-    data.fn.append(
-        np.count_nonzero(np.logical_and(ground_truth, np.logical_not(pred)))),
-    return data
-
-def get_success_metrics(data: PredictionData) -> tuple[float, float, float]:
-    length = len(data.tp)
-    precision = [data.tp[x]/(data.tp[x] + data.fp[x]) for x in range(length)]
-    recall = [data.tp[x]/(data.tp[x] + data.fn[x]) for x in range(length)]
-    accuracy = [(data.tp[x] + data.tn[x])/(data.tp[x] + data.fp[x] + data.tn[x] + data.fn[x]) for x in range(length)]
+def compute_timewidths(fname: str) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    # Time widths straight from a merged event file (see SimulationAnalysis/mergeSim_main.py),
+    # with its ground truth saved next to it
+    pydir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, pydir)
+    sys.path.insert(0, os.path.join(pydir, "SimulationAnalysis"))
+    # pylint: disable=import-outside-toplevel
+    from ebsnor_core import CameraDims, EBSnoRFilter, FilterWindows
+    from eventcache import EventCache
+    from eventsource import load_events
+
+    ground_truth = np.load(fname.replace(".dat", "_groundTruth.npy"))
+    ebsnor = EBSnoRFilter(
+        CameraDims(CAMERA_DIM_X, CAMERA_DIM_Y),
+        FilterWindows(EBSNOR_TIME_WINDOW, EBSNOR_SPATIAL_WINDOW),
+        EBSNOR_BACKEND
+    )
+    # Widths of ROC_MAX_ETA and above never count as snow, so those pairs are skipped
+    max_width = int(ROC_MAX_ETA)
+    if USE_EVENT_CACHE:
+        return ground_truth, EventCache().time_widths(fname, ebsnor, max_width)
+    return ground_truth, ebsnor.time_widths(load_events(fname), max_width)._asdict()
+
+def get_tp_fp_tn_fn(twidths: np.ndarray, ground_truth: np.ndarray, etas) -> PredictionData:
+    # An event is predicted as snow when its time width is below eta, so the
+    # counts at every eta come from one searchsorted over the sorted widths
+    is_snow = np.asarray(ground_truth).astype(bool)
+    snow_twidths = np.sort(twidths[is_snow])
+    nosnow_twidths = np.sort(twidths[np.logical_not(is_snow)])
+    tp = np.searchsorted(snow_twidths, etas, side="left")
+    fp = np.searchsorted(nosnow_twidths, etas, side="left")
+    return PredictionData(
+        tp=tp,
+        fp=fp,
+        tn=len(nosnow_twidths) - fp,
+        fn=len(snow_twidths) - tp,
+        gt_snow=len(snow_twidths),
+        gt_nosnow=len(nosnow_twidths)
+    )
+
+def get_success_metrics(data: PredictionData) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = data.tp/(data.tp + data.fp)
+        recall = data.tp/(data.tp + data.fn)
+        accuracy = (data.tp + data.tn)/(data.tp + data.fp + data.tn + data.fn)
     return precision, recall, accuracy
 
 def get_success_rates(data: PredictionData) -> PredictionData:
-    tp_rate = [tp/data.gt_snow for tp in data.tp]
-    fp_rate = [fp/data.gt_nosnow for fp in data.fp]
-    tn_rate = [tn/data.gt_nosnow for tn in data.tn]
-    fn_rate = [fn/data.gt_snow for fn in data.fn]
-
     rates = PredictionData(
-        tp=tp_rate,
-        fp=fp_rate,
-        tn=tn_rate,
-        fn=fn_rate,
+        tp=data.tp/data.gt_snow,
+        fp=data.fp/data.gt_nosnow,
+        tn=data.tn/data.gt_nosnow,
+        fn=data.fn/data.gt_snow,
         gt_snow=0,
         gt_nosnow=0
     )
     return rates
 
+def get_auc(fp_rate: np.ndarray, tp_rate: np.ndarray) -> float:
+    fp_rate = np.concatenate(([0], fp_rate, [1]))
+    tp_rate = np.concatenate(([0], tp_rate, [1]))
+    return float(np.trapezoid(tp_rate, fp_rate))
+
 if __name__ == "__main__":
     gen_results = {
         "no_ie" : GEN_NO_IE,
@@ -116,8 +163,11 @@ if __name__ == "__main__":
         "per_pixel" : GEN_PER_PIXEL,
         "adaptive_win" : GEN_ADAPTIVE_WINDOW
     }
-    fpath = TIMEWIDTHS_FPATH.format(CAR_VELOCITY)
-    ground_truth, twidth_data = get_timewidths(fpath)
+    if COMPUTE_TIMEWIDTHS:
+        ground_truth, twidth_data = compute_timewidths(EVENTS_FPATH.format(CAR_VELOCITY))
+    else:
+        ground_truth, twidth_data = get_timewidths(TIMEWIDTHS_FPATH.format(CAR_VELOCITY))
+    roc_etas = np.geomspace(ROC_MIN_ETA, ROC_MAX_ETA, ROC_NUM_ETAS)
     results: list[ResultsStruct] = []
     labels = [
         "No IE Filter",
@@ -127,35 +177,32 @@ if __name__ == "__main__":
         "Per Pixel"
     ]
     for idx, (key, enable) in enumerate(gen_results.items()):
-        pred_data=PredictionData(
-            tp=[],
-            fp=[],
-            tn=[],
-            fn=[],
-            gt_snow=np.sum(ground_truth),
-            gt_nosnow=np.sum(np.logical_not(ground_truth))
-        )
         if enable:
             twidths = twidth_data[key]
-            for eta in ETAS:
-                snow_pred = np.less(twidths, eta)
-                pred_data = get_tp_fp_tn_fn(pred_data, snow_pred, ground_truth)
-            precision, recall, accuracy = get_success_metrics(pred_data)
+            pred_data = get_tp_fp_tn_fn(twidths, ground_truth, ETAS)
+            _, _, accuracy = get_success_metrics(pred_data)
             rates = get_success_rates(pred_data)
+
+            sweep_data = get_tp_fp_tn_fn(twidths, ground_truth, roc_etas)
+            precision, recall, sweep_accuracy = get_success_metrics(sweep_data)
+            sweep_rates = get_success_rates(sweep_data)
             roc_data = ResultsStruct(
+                etas=roc_etas,
                 precision=precision,
                 recall=recall,
-                accuracy=accuracy,
-                tp_rate=rates.tp,
-                fp_rate=rates.fp,
-                tn_rate=rates.tn,
-                fn_rate=rates.fn
+                accuracy=sweep_accuracy,
+                tp_rate=sweep_rates.tp,
+                fp_rate=sweep_rates.fp,
+                tn_rate=sweep_rates.tn,
+                fn_rate=sweep_rates.fn,
+                auc=get_auc(sweep_rates.fp, sweep_rates.tp)
             )
             print(f"\n{labels[idx]}\n=====\n")
             print(f"Eta = {ETAS[RESULTS_PRINT_IDX[idx]]}")
             print(f"\tFP Rate:   {rates.fp[RESULTS_PRINT_IDX[idx]]}")
             print(f"\tTP Rate:   {rates.tp[RESULTS_PRINT_IDX[idx]]}")
             print(f"\tAccuracy:   {accuracy[RESULTS_PRINT_IDX[idx]]}")
+            print(f"AUC = {roc_data.auc}")
             results.append(roc_data)
 
     idx = 0
@@ -166,7 +213,7 @@ if __name__ == "__main__":
             plt.plot(
                 results[idx].fp_rate,
                 results[idx].tp_rate,
-                "{}.-".format(colors[idx]),
+                "{}-".format(colors[idx]),
                 label=labels[lbl_idx]
             )
             plt.plot(
@@ -1,42 +1,56 @@
-from typing import List, Tuple
+from typing import Iterator, Tuple
 import h5py
 import numpy as np
+from numpy.typing import NDArray
 
 ###############################################################################
 # Data paths, replace with corresponding paths on your system
 MAT_FILEPATH = ""                   # MAT data filepath
 ###############################################################################
 
+###############################################################################
+# Settings, replace desired values
+CHUNK_SIZE = 1000000                # Events converted per write
+###############################################################################
+
 HEADER_DATA = "% Height 720\n% Version 2\n% Width 1280\n% date 2023-11-26 19:27:11\n"
 EVT_DATA = int.to_bytes(0x0C, byteorder="little", length=1) \
     + int.to_bytes(0x08, byteorder="little", length=1)
+DAT_RECORD_DTYPE = np.dtype([("ts", "<u4"), ("addr", "<u4")])
 
-def read_matfile_data(fname: str) -> Tuple[List[int], List[int], List[int], List[int]]:
+def read_matfile_chunks(
+    fname: str,
+    chunk_size: int = CHUNK_SIZE
+) -> Iterator[Tuple[NDArray[np.int64], NDArray[np.int64], NDArray[np.int64], NDArray[np.int64]]]:
     with h5py.File(fname, "r") as matfile:
-        xdata = np.array(matfile.get("x")[0]).astype(int).tolist()  # type: ignore
-        ydata = np.array(matfile.get("y")[0]).astype(int).tolist()  # type: ignore
-        pdata = np.array(matfile.get("p")[0]).astype(int).tolist()  # type: ignore
-        tdata = np.array(matfile.get("ts")[0]).astype(int).tolist() # type: ignore
-
-    return xdata, ydata, pdata, tdata
-
-def create_datfile_evt(xval: int, yval: int, pval: int, tval: int) -> bytes:
-    rval = int.to_bytes(tval, length=4, byteorder="little")
-    rval += int.to_bytes(
-        (pval & 0x0001) << 28 | (yval & 0x3FFF) << 14 | (xval & 0x3FFF) << 0,
-        length=4,
-        byteorder="little"
-    )
-    return rval
+        xset, yset, pset, tset = matfile["x"], matfile["y"], matfile["p"], matfile["ts"]
+        for start in range(0, tset.shape[-1], chunk_size): # type: ignore
+            stop = start + chunk_size
+            yield (
+                xset[0, start:stop].astype(np.int64),   # type: ignore
+                yset[0, start:stop].astype(np.int64),   # type: ignore
+                pset[0, start:stop].astype(np.int64),   # type: ignore
+                tset[0, start:stop].astype(np.int64)    # type: ignore
+            )
+
+def create_datfile_evts(
+    xdata: NDArray[np.int64],
+    ydata: NDArray[np.int64],
+    pdata: NDArray[np.int64],
+    tdata: NDArray[np.int64]
+) -> NDArray:
+    evts = np.empty(len(tdata), dtype=DAT_RECORD_DTYPE)
+    evts["ts"] = tdata & 0xFFFFFFFF
+    evts["addr"] = (pdata & 0x0001) << 28 | (ydata & 0x3FFF) << 14 | (xdata & 0x3FFF) << 0
+    return evts
 
 def main() -> None:
-    xdata, ydata, pdata, tdata = read_matfile_data(MAT_FILEPATH)
     savepath = MAT_FILEPATH.replace(".mat", ".dat")
     with open(savepath, "wb") as datfile:
         datfile.write(HEADER_DATA.encode("ascii"))
         datfile.write(EVT_DATA)
-        for xval, yval, pval, tval in zip(xdata, ydata, pdata, tdata):
-            datfile.write(create_datfile_evt(xval, yval, pval, tval))
+        for xdata, ydata, pdata, tdata in read_matfile_chunks(MAT_FILEPATH, CHUNK_SIZE):
+            create_datfile_evts(xdata, ydata, pdata, tdata).tofile(datfile)
 
     print(f"Conversion complete. Saved to {savepath}")
 
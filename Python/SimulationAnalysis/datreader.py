@@ -1,48 +1,77 @@
 from io import BufferedReader
 import os
 from typing import Callable
-
-from events import Event2d, EventExtTrigger, EventFieldBytes, EventTypes
-
-def _read_Event2d(datfile: BufferedReader, ts_offs: int) -> Event2d:
-        timestamp = int.from_bytes(datfile.read(EventFieldBytes.TIMESTAMP), byteorder="little")
-        addr = int.from_bytes(datfile.read(EventFieldBytes.ADDR), byteorder="little")
-        evt = Event2d(
-            x=(addr & 0x00003FFF) >> 0,
-            y=(addr & 0x0FFFC000) >> 14,
-            p=(addr & 0x10000000) >> 28,
-            ts=timestamp + ts_offs
-        )
-        return evt
-
-def _read_EventExtTrigger(datfile: BufferedReader, ts_offs: int) -> EventExtTrigger:
-    timestamp = int.from_bytes(datfile.read(EventFieldBytes.TIMESTAMP), byteorder="little")
-    addr = int.from_bytes(datfile.read(EventFieldBytes.ADDR), byteorder="little")
-    evt = EventExtTrigger(
-        id=(addr & 0x0000003F) >> 0,
-        pad1=(addr & 0x0FFFFFC0) >> 6,
-        p=(addr & 0x10000000) >> 28,
-        ts=timestamp + ts_offs
-    )
-    return evt
+import numpy as np
+
+from events import (
+    DAT_RECORD_DTYPE,
+    EVENT2D_DTYPE,
+    EVENT_EXT_TRIGGER_DTYPE,
+    Event2d,
+    Event2dBatch,
+    EventBatch,
+    EventExtTrigger,
+    EventExtTriggerBatch,
+    EventFieldBytes,
+    EventTypes
+)
+
+def _decode_Event2d(raw: np.ndarray, ts_offs: int) -> np.ndarray:
+    addr = raw["addr"]
+    evts = np.empty(len(raw), dtype=EVENT2D_DTYPE)
+    evts["x"] = (addr & 0x00003FFF) >> 0
+    evts["y"] = (addr & 0x0FFFC000) >> 14
+    evts["p"] = (addr & 0x10000000) >> 28
+    evts["t"] = raw["ts"].astype(np.int64) + ts_offs
+    return evts
+
+def _decode_EventExtTrigger(raw: np.ndarray, ts_offs: int) -> np.ndarray:
+    addr = raw["addr"]
+    evts = np.empty(len(raw), dtype=EVENT_EXT_TRIGGER_DTYPE)
+    evts["id"] = (addr & 0x0000003F) >> 0
+    evts["p"] = (addr & 0x10000000) >> 28
+    evts["t"] = raw["ts"].astype(np.int64) + ts_offs
+    return evts
 
 class DatReader:
+    INDEX_STRIDE = 4096                 # Events between timestamp index entries
+
     def __init__(self, fname: str) -> None:
-        self._datfile: BufferedReader = None #type: ignore
+        self._records: np.ndarray = None # type: ignore
+        self._ts_index: np.ndarray = None # type: ignore
         self._at_eof: bool = False
         self._eof: int = None # type: ignore
-        self._read_single: Callable[[BufferedReader, int], Event2d | EventExtTrigger] = None # type: ignore
+        self._data_start: int = None # type: ignore
+        self._idx: int = 0
+        self._decode: Callable[[np.ndarray, int], np.ndarray] = None # type: ignore
+        self._to_batch: Callable[[np.ndarray], EventBatch] = None # type: ignore
         self._ts_offs = 0
 
-        self._datfile = open(fname, "rb")
-        self._eof, evtype = self._get_fileinfo()
+        with open(fname, "rb") as datfile:
+            self._eof, self._data_start, evtype = self._get_fileinfo(datfile)
         if evtype in [EventTypes.EVENT_2D, EventTypes.EVENT_CD]:
-            self._read_single = _read_Event2d
+            self._decode = _decode_Event2d
+            self._to_batch = Event2dBatch
         elif evtype == EventTypes.EVENT_EXT_TRIGGER:
-            self._read_single = _read_EventExtTrigger
+            self._decode = _decode_EventExtTrigger
+            self._to_batch = EventExtTriggerBatch
         else:
             raise ValueError(f"Unknown event type: {evtype}")
 
+        num_evts = (self._eof - self._data_start) // EventFieldBytes.TOTAL
+        self._eof = self._data_start + num_evts * EventFieldBytes.TOTAL
+        if num_evts > 0:
+            self._records = np.memmap(
+                fname,
+                dtype=DAT_RECORD_DTYPE,
+                mode="r",
+                offset=self._data_start,
+                shape=(num_evts,)
+            )
+        else:
+            self._records = np.empty(0, dtype=DAT_RECORD_DTYPE)
+        self._ts_index = self._records["ts"][::self.INDEX_STRIDE].astype(np.int64)
+
     def __enter__(self):
         return self
 
@@ -50,23 +79,51 @@ class DatReader:
         del exc_type, exc_value, traceback
         self.close()
 
+    def __len__(self) -> int:
+        return len(self._records)
+
     def close(self) -> None:
-        self._datfile.close()
+        # The mapping is released once the last view into it is dropped
+        self._records = np.empty(0, dtype=DAT_RECORD_DTYPE)
+        self._ts_index = np.empty(0, dtype=np.int64)
 
     def pos(self) -> int:
-        return self._datfile.tell()
+        return self._data_start + self._idx * EventFieldBytes.TOTAL
 
     def set_pos(self, pos: int) -> None:
-        self._datfile.seek(pos)
+        self._idx = max(0, (pos - self._data_start) // EventFieldBytes.TOTAL)
+        self._at_eof = self._idx >= len(self._records)
 
     def read_event(self) -> Event2d | EventExtTrigger:
-        evt = self._read_single(self._datfile, self._ts_offs)
+        evt = self._to_batch(self._decode(self._read_raw(1), self._ts_offs))[0]
         return evt
 
-    def read_events(self, lim: int, by_ts: bool = False) -> list[Event2d | EventExtTrigger]:
+    def read_events(self, lim: int, by_ts: bool = False) -> EventBatch:
+        return self._to_batch(self.read_array(lim, by_ts))
+
+    def read_array(self, lim: int, by_ts: bool = False) -> np.ndarray:
         evts = self._read_win(lim) if by_ts else self._read_num(lim)
         return evts
 
+    def read_time_window(self, t_start: int, t_end: int) -> np.ndarray:
+        """Decode all events with t_start <= t < t_end, independent of the read position."""
+        return self._decode(self.raw_time_window(t_start, t_end), self._ts_offs)
+
+    def raw_time_window(self, t_start: int, t_end: int) -> np.ndarray:
+        """Zero-copy view of the undecoded records with t_start <= t < t_end."""
+        first = self.search_ts(t_start)
+        last = self.search_ts(t_end)
+        return self._records[first:max(first, last)]
+
+    def search_ts(self, timestamp: int, side: str = "left") -> int:
+        """Event index of `timestamp` (offset applied) in the time-ordered file."""
+        raw_ts = timestamp - self._ts_offs
+        block = int(np.searchsorted(self._ts_index, raw_ts, side=side)) # type: ignore
+        lo = max(block - 1, 0) * self.INDEX_STRIDE
+        hi = min(block * self.INDEX_STRIDE + 1, len(self._records))
+        block_ts = self._records["ts"][lo:hi].astype(np.int64)
+        return lo + int(np.searchsorted(block_ts, raw_ts, side=side)) # type: ignore
+
     def set_ts_offset(self, offs: int) -> None:
         self._ts_offs = offs
 
@@ -74,46 +131,43 @@ class DatReader:
         return self._at_eof
 
     def reset_read(self) -> None:
-        self._datfile.seek(0)
+        self._idx = 0
+        self._at_eof = False
 
-    def _get_fileinfo(self) -> tuple[int, int]:
-        self._datfile.seek(0, os.SEEK_END)
-        eof = self._datfile.tell()
-        self._datfile.seek(0)
+    def _get_fileinfo(self, datfile: BufferedReader) -> tuple[int, int, int]:
+        datfile.seek(0, os.SEEK_END)
+        eof = datfile.tell()
+        datfile.seek(0)
         while True:
-            char = self._datfile.read(1)
+            char = datfile.read(1)
             try:
                 if char.decode("ascii") == "%":
-                    self._datfile.readline()
+                    datfile.readline()
                     continue
             except UnicodeDecodeError:
                 pass
-            self._datfile.read(1)
+            datfile.read(1)
             break
-        return eof, int.from_bytes(char, byteorder="little")
-
-    def _read_num(self, num_evts: int) -> list[Event2d | EventExtTrigger]:
-        evts = []
-        for _ in range(num_evts):
-            evt = self._read_single(self._datfile, self._ts_offs)
-            evts.append(evt)
-            if self._datfile.tell() >= self._eof:
-                self._at_eof = True
-                break
+        return eof, datfile.tell(), int.from_bytes(char, byteorder="little")
+
+    def _read_raw(self, num_evts: int) -> np.ndarray:
+        raw = self._records[self._idx:self._idx + num_evts]
+        self._idx += len(raw)
+        return raw
+
+    def _read_num(self, num_evts: int) -> np.ndarray:
+        evts = self._decode(self._read_raw(num_evts), self._ts_offs)
+        if self._idx >= len(self._records):
+            self._at_eof = True
         return evts
 
-    def _read_win(self, t_window: int) -> list[Event2d | EventExtTrigger]:
-        evts = []
-        evt = self._read_single(self._datfile, self._ts_offs)
-        max_ts = evt.ts + t_window
-        evts.append(evt)
-        while True:
-            evt = self._read_single(self._datfile, self._ts_offs)
-            if evt.ts > max_ts:
-                self._datfile.seek(-EventFieldBytes.TOTAL, os.SEEK_CUR)
-                break
-            evts.append(evt)
-            if self.pos() >= self._eof:
-                self._at_eof = True
-                break
+    def _read_win(self, t_window: int) -> np.ndarray:
+        if self._idx >= len(self._records):
+            self._at_eof = True
+            return self._decode(self._read_raw(0), self._ts_offs)
+        max_ts = int(self._records["ts"][self._idx]) + self._ts_offs + t_window
+        last = max(self.search_ts(max_ts, side="right"), self._idx + 1)
+        evts = self._decode(self._read_raw(last - self._idx), self._ts_offs)
+        if self._idx >= len(self._records):
+            self._at_eof = True
         return evts
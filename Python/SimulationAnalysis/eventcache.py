@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict
+import h5py
+import numpy as np
+
+from events import EVENT2D_DTYPE
+from eventsource import ChunkMode, EventChunkIterator
+
+CACHE_DIR = os.environ.get(
+    "EBSNOR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ebsnor"))
+CACHE_CHUNK_SIZE = 1 << 16              # Events per HDF5 chunk (and timestamp index entry)
+CACHE_COMPRESSION = "lzf"               # Fast h5py compression filter
+HASH_BLOCK_SIZE = 1 << 24               # Bytes hashed per file read
+CACHE_FORMAT = 2                        # Bumped whenever the cached event columns change
+EBSNOR_VERSION = 3                      # Bumped whenever the EBSnoR outputs change
+
+# Cached column dtypes
+_COLUMNS = {"x": np.uint16, "y": np.uint16, "p": np.int8, "t": np.int64}
+
+def file_hash(fname: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(fname, "rb") as evtfile:
+        while block := evtfile.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+def ebsnor_key(ebsnor: Any, adaptive_window: bool | None = None) -> str:
+    # Everything the EBSnoR outputs depend on; the backend and tiling do not change them
+    key = (
+        f"v{EBSNOR_VERSION}_{ebsnor.cam_x}x{ebsnor.cam_y}"
+        f"_ie{ebsnor.IE_TIME_WINDOW}_te{ebsnor.TE_DEPTH}"
+        f"_tw{ebsnor.time_window}_sw{ebsnor.spatial_window}"
+    )
+    if adaptive_window is not None:
+        key += "_adaptive" if adaptive_window else "_fixed"
+    return key
+
+class CachedEventReader:
+    """DatReader-style reader for an event cache file."""
+    def __init__(self, fname: str) -> None:
+        self._h5file = h5py.File(fname, "r")
+        group = self._h5file["events"]
+        self._columns = {name: group[name] for name in _COLUMNS}
+        self._ts_index: np.ndarray = group["ts_index"][:] # type: ignore
+        self._chunk_size: int = int(group.attrs["chunk_size"]) # type: ignore
+        self._len = len(self._columns["t"])
+        self._idx = 0
+        self._at_eof = self._len == 0
+        self._ts_offs = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        del exc_type, exc_value, traceback
+        self.close()
+
+    def __len__(self) -> int:
+        return self._len
+
+    def close(self) -> None:
+        self._h5file.close()
+
+    def pos(self) -> int:
+        return self._idx
+
+    def set_pos(self, pos: int) -> None:
+        self._idx = pos
+        self._at_eof = self._idx >= self._len
+
+    def read_array(self, lim: int, by_ts: bool = False) -> np.ndarray:
+        if by_ts and self._idx < self._len:
+            max_ts = int(self._columns["t"][self._idx]) + self._ts_offs + lim
+            lim = max(self.search_ts(max_ts, side="right"), self._idx + 1) - self._idx
+        evts = self._read(self._idx, min(self._idx + lim, self._len))
+        self._idx += len(evts)
+        self._at_eof = self._idx >= self._len
+        return evts
+
+    def read_time_window(self, t_start: int, t_end: int) -> np.ndarray:
+        """Decode all events with t_start <= t < t_end, independent of the read position."""
+        first = self.search_ts(t_start)
+        return self._read(first, max(first, self.search_ts(t_end)))
+
+    def search_ts(self, timestamp: int, side: str = "left") -> int:
+        """Event index of `timestamp` (offset applied), only reading one chunk of timestamps."""
+        raw_ts = timestamp - self._ts_offs
+        block = int(np.searchsorted(self._ts_index, raw_ts, side=side)) # type: ignore
+        lo = max(block - 1, 0) * self._chunk_size
+        hi = min(block * self._chunk_size + 1, self._len)
+        block_ts = self._columns["t"][lo:hi]
+        return lo + int(np.searchsorted(block_ts, raw_ts, side=side)) # type: ignore
+
+    def set_ts_offset(self, offs: int) -> None:
+        self._ts_offs = offs
+
+    def finished(self) -> bool:
+        return self._at_eof
+
+    def reset_read(self) -> None:
+        self._idx = 0
+        self._at_eof = self._len == 0
+
+    def _read(self, first: int, last: int) -> np.ndarray:
+        evts = np.empty(last - first, dtype=EVENT2D_DTYPE)
+        if last > first:
+            for name, column in self._columns.items():
+                evts[name] = column[first:last]
+            evts["t"] += self._ts_offs
+        return evts
+
+class EventCache:
+    """Event files converted once to compressed columnar HDF5, plus cached EBSnoR outputs.
+
+    Each recording is cached as `<cache_dir>/<content hash>_f<CACHE_FORMAT>.h5`:
+    an `events` group with chunked x/y/p/t columns and the first timestamp of
+    every chunk, and one group per EBSnoR output keyed by the filter parameters.
+    """
+    def __init__(self, cache_dir: str = CACHE_DIR, chunk_size: int = CACHE_CHUNK_SIZE) -> None:
+        self.cache_dir = cache_dir
+        self.chunk_size = chunk_size
+        self._hash_file = os.path.join(cache_dir, "file_hashes.json")
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, fname: str) -> str:
+        return os.path.join(self.cache_dir, f"{self._file_hash(fname)}_f{CACHE_FORMAT}.h5")
+
+    def open(self, fname: str) -> CachedEventReader:
+        cache_fname = self.path(fname)
+        if not os.path.exists(cache_fname):
+            self._convert(fname, cache_fname)
+        return CachedEventReader(cache_fname)
+
+    def load_events(self, fname: str) -> np.ndarray:
+        with self.open(fname) as reader:
+            return reader.read_array(len(reader))
+
+    def cached(
+        self,
+        fname: str,
+        group: str,
+        compute: Callable[[], Dict[str, np.ndarray]]
+    ) -> Dict[str, np.ndarray]:
+        # Arrays stored under `group` of the recording's cache file, computed on a miss
+        cache_fname = self.path(fname)
+        if not os.path.exists(cache_fname):
+            self._convert(fname, cache_fname)
+        with h5py.File(cache_fname, "r") as h5file:
+            if group in h5file:
+                return {name: data[:] for name, data in h5file[group].items()} # type: ignore
+        arrays = compute()
+        with h5py.File(cache_fname, "a") as h5file:
+            out = h5file.require_group(group)
+            for name, data in arrays.items():
+                out.create_dataset(name, data=data, compression=CACHE_COMPRESSION, shuffle=True)
+        return arrays
+
+    def snow_labels(
+        self,
+        fname: str,
+        ebsnor: Any,
+        adaptive_window: bool = False
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return the cached `(is_ie, is_snow)` labels of a whole recording."""
+        def compute() -> Dict[str, np.ndarray]:
+            evts = self.load_events(fname)
+            is_ie, te_next = ebsnor.ie_filter(evts, ebsnor.IE_TIME_WINDOW, ebsnor.TE_DEPTH)
+            is_snow = ebsnor.ebsnor_filter(evts, is_ie, te_next, adaptive_window)
+            return {"is_ie": is_ie, "is_snow": is_snow}
+        labels = self.cached(fname, f"ebsnor/{ebsnor_key(ebsnor, adaptive_window)}", compute)
+        return labels["is_ie"], labels["is_snow"]
+
+    def time_widths(
+        self,
+        fname: str,
+        ebsnor: Any,
+        max_width: int | None = None
+    ) -> Dict[str, np.ndarray]:
+        """Return the cached `ebsnor.time_widths()` of a whole recording, by variant name."""
+        def compute() -> Dict[str, np.ndarray]:
+            return ebsnor.time_widths(self.load_events(fname), max_width)._asdict()
+        key = ebsnor_key(ebsnor) + (f"_mw{max_width}" if max_width is not None else "")
+        return self.cached(fname, f"time_widths/{key}", compute)
+
+    def _file_hash(self, fname: str) -> str:
+        # Content hashes are remembered per path, size and modification time
+        stat = os.stat(fname)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        hashes = {}
+        if os.path.exists(self._hash_file):
+            with open(self._hash_file, "r", encoding="utf-8") as hashfile:
+                hashes = json.load(hashfile)
+        entry = hashes.get(os.path.abspath(fname))
+        if entry is not None and entry[:2] == stamp:
+            return entry[2]
+        digest = file_hash(fname)
+        hashes[os.path.abspath(fname)] = [*stamp, digest]
+        tmp_fname = f"{self._hash_file}.{os.getpid()}.tmp"
+        with open(tmp_fname, "w", encoding="utf-8") as hashfile:
+            json.dump(hashes, hashfile)
+        os.replace(tmp_fname, self._hash_file)
+        return digest
+
+    def _convert(self, fname: str, cache_fname: str) -> None:
+        # Written to a temporary file first, so an interrupted conversion is never used
+        tmp_fname = f"{cache_fname}.{os.getpid()}.tmp"
+        with h5py.File(tmp_fname, "w") as h5file:
+            group = h5file.create_group("events")
+            group.attrs["source"] = os.path.basename(fname)
+            group.attrs["chunk_size"] = self.chunk_size
+            columns = {
+                name: group.create_dataset(
+                    name,
+                    shape=(0,),
+                    maxshape=(None,),
+                    dtype=dtype,
+                    chunks=(self.chunk_size,),
+                    compression=CACHE_COMPRESSION,
+                    shuffle=True
+                )
+                for name, dtype in _COLUMNS.items()
+            }
+            num_evts = 0
+            ts_index = [np.zeros(0, dtype=np.int64)]
+            chunks = EventChunkIterator(fname, ChunkMode.N_EVENTS, n_events=16 * self.chunk_size)
+            for evts in chunks:
+                for name, column in columns.items():
+                    column.resize((num_evts + len(evts),))
+                    column[num_evts:] = evts[name]
+                ts_index.append(evts["t"][::self.chunk_size])
+                num_evts += len(evts)
+            group.create_dataset("ts_index", data=np.concatenate(ts_index))
+        os.replace(tmp_fname, cache_fname)
@@ -1,6 +1,9 @@
+from abc import ABC, abstractmethod
 from dataclasses import dataclass, InitVar
+from typing import Iterator
+import numpy as np
 
-@dataclass
+@dataclass(slots=True)
 class Event2d:
     x: int
     y: int
@@ -10,7 +13,7 @@ class Event2d:
     def __hash__(self):
         return hash((self.x, self.y, self.ts))
 
-@dataclass
+@dataclass(slots=True)
 class EventExtTrigger:
     id: int
     p: int
@@ -31,3 +34,85 @@ class EventFieldBytes:
     TOTAL = 8
     TIMESTAMP = 4
     ADDR = 4
+
+# Structured array layouts, matching the Metavision EventCD/EventExtTrigger buffers
+EVENT2D_DTYPE = np.dtype([("x", "<u2"), ("y", "<u2"), ("p", "<i2"), ("t", "<i8")])
+EVENT_EXT_TRIGGER_DTYPE = np.dtype([("p", "<i2"), ("t", "<i8"), ("id", "<i2")])
+
+# Raw .dat record layout: 32-bit timestamp followed by a 32-bit address word
+DAT_RECORD_DTYPE = np.dtype([("ts", "<u4"), ("addr", "<u4")])
+
+def to_Event2d(evts: np.ndarray) -> list[Event2d]:
+    iter_ev = zip(evts["x"].tolist(), evts["y"].tolist(), evts["p"].tolist(), evts["t"].tolist())
+    return [Event2d(x=xval, y=yval, p=pval, ts=tval) for xval, yval, pval, tval in iter_ev]
+
+def to_EventExtTrigger(evts: np.ndarray) -> list[EventExtTrigger]:
+    iter_ev = zip(evts["id"].tolist(), evts["p"].tolist(), evts["t"].tolist())
+    return [EventExtTrigger(id=idval, p=pval, ts=tval) for idval, pval, tval in iter_ev]
+
+class EventBatch(ABC):
+    """Array-backed batch of events, one structured array instead of one object per event.
+
+    Integer indexing and iteration create record objects on demand, slicing
+    returns a batch viewing the same array.
+    """
+    __slots__ = ("evts",)
+    RECORD_BLOCK = 65536                # Records created at a time while iterating
+
+    def __init__(self, evts: np.ndarray) -> None:
+        self.evts = evts
+
+    def __len__(self) -> int:
+        return len(self.evts)
+
+    def __iter__(self) -> Iterator:
+        for start in range(0, len(self.evts), self.RECORD_BLOCK):
+            yield from self._to_records(self.evts[start:start + self.RECORD_BLOCK])
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            if not -len(self.evts) <= idx < len(self.evts):
+                raise IndexError(f"Event index out of range: {idx}")
+            return self._to_records(self.evts[idx:][:1])[0]
+        return type(self)(self.evts[idx])
+
+    @staticmethod
+    @abstractmethod
+    def _to_records(evts: np.ndarray) -> list:
+        """Record objects for a structured array of events."""
+
+class Event2dBatch(EventBatch):
+    __slots__ = ()
+    _to_records = staticmethod(to_Event2d)
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.evts["x"]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.evts["y"]
+
+    @property
+    def p(self) -> np.ndarray:
+        return self.evts["p"]
+
+    @property
+    def ts(self) -> np.ndarray:
+        return self.evts["t"]
+
+class EventExtTriggerBatch(EventBatch):
+    __slots__ = ()
+    _to_records = staticmethod(to_EventExtTrigger)
+
+    @property
+    def id(self) -> np.ndarray:
+        return self.evts["id"]
+
+    @property
+    def p(self) -> np.ndarray:
+        return self.evts["p"]
+
+    @property
+    def ts(self) -> np.ndarray:
+        return self.evts["t"]
@@ -0,0 +1,197 @@
+from enum import Enum
+import os
+from typing import Any, Iterator, Protocol
+import numpy as np
+
+from datreader import DatReader
+from events import EVENT2D_DTYPE
+from matreader import MatReader
+
+READ_BLOCK_SIZE = 1 << 20              # Events decoded per file read
+
+class ChunkMode(Enum):
+    N_EVENTS = "n_events"               # Fixed number of events per chunk
+    DELTA_T = "delta_t"                 # Fixed time window per chunk
+
+class _BlockReader(Protocol):
+    def read_block(self, num_evts: int) -> np.ndarray: ...
+    def finished(self) -> bool: ...
+    def close(self) -> None: ...
+
+class _ArrayReader:
+    # Reader for events held in a structured array, e.g. a memory-mapped .npy
+    def __init__(self, evts: np.ndarray) -> None:
+        missing = {"x", "y", "p", "t"} - set(evts.dtype.names or ())
+        if missing:
+            raise ValueError(f"Event array is missing fields: {sorted(missing)}")
+        self._evts = evts
+        self._idx = 0
+
+    def read_block(self, num_evts: int) -> np.ndarray:
+        block = self._evts[self._idx:self._idx + num_evts]
+        self._idx += len(block)
+        if block.dtype == EVENT2D_DTYPE:
+            return block
+        evts = np.empty(len(block), dtype=EVENT2D_DTYPE)
+        for name in EVENT2D_DTYPE.names: # type: ignore
+            evts[name] = block[name]
+        return evts
+
+    def finished(self) -> bool:
+        return self._idx >= len(self._evts)
+
+    def close(self) -> None:
+        self._evts = self._evts[:0]
+
+class _FileReader:
+    # DatReader/MatReader/CachedEventReader adapter
+    def __init__(self, reader: Any) -> None:
+        self._reader = reader
+
+    def read_block(self, num_evts: int) -> np.ndarray:
+        return self._reader.read_array(num_evts)
+
+    def finished(self) -> bool:
+        return self._reader.finished()
+
+    def close(self) -> None:
+        self._reader.close()
+
+class _RawReader:
+    # Metavision .raw files, only readable with the Metavision SDK installed
+    def __init__(self, fname: str) -> None:
+        try:
+            from metavision_core.event_io import RawReader # pylint: disable=import-outside-toplevel
+        except ImportError as err:
+            raise ImportError("Reading .raw files requires the Metavision SDK") from err
+        self._reader = RawReader(fname)
+
+    def read_block(self, num_evts: int) -> np.ndarray:
+        # The SDK reuses its buffer between loads
+        return self._reader.load_n_events(num_evts).copy()
+
+    def finished(self) -> bool:
+        return self._reader.is_done()
+
+    def close(self) -> None:
+        del self._reader
+
+def _open_reader(fname: str) -> _BlockReader:
+    ext = os.path.splitext(fname)[1].lower()
+    if ext == ".dat":
+        return _FileReader(DatReader(fname))
+    if ext == ".mat":
+        return _FileReader(MatReader(fname))
+    if ext == ".npy":
+        return _ArrayReader(np.load(fname, mmap_mode="r"))
+    if ext == ".raw":
+        return _RawReader(fname)
+    if ext == ".h5":
+        # Event cache files (see eventcache.py), which are written through this module
+        from eventcache import CachedEventReader # pylint: disable=import-outside-toplevel
+        return _FileReader(CachedEventReader(fname))
+    raise ValueError(f"Unsupported event file type: {ext}")
+
+class EventChunkIterator:
+    """Iterate over an event file (.dat, .mat, .npy, .raw or cached .h5) in chunks.
+
+    Chunks are structured arrays with the Metavision EventCD layout (`x`, `y`,
+    `p`, `t`), cut either every `n_events` events or every `delta_t` us from
+    `start_ts`, like `metavision_core.event_io.EventsIterator` with absolute
+    timestamps. Chunks within one read block are views into it.
+    """
+    def __init__(
+        self,
+        fname: str,
+        mode: ChunkMode | str = ChunkMode.DELTA_T,
+        delta_t: int = 10000,
+        n_events: int = 10000,
+        start_ts: int = 0,
+        block_size: int = READ_BLOCK_SIZE
+    ) -> None:
+        self.mode = ChunkMode(mode)
+        self.delta_t = delta_t
+        self.n_events = n_events
+        self.start_ts = start_ts
+        self._fname = fname
+        self._block_size = max(block_size, n_events if self.mode == ChunkMode.N_EVENTS else 1)
+        self._current_time = start_ts
+
+    def get_current_time(self) -> int:
+        # End of the last delta_t window, or the last event timestamp in n_events mode
+        return self._current_time
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        reader = _open_reader(self._fname)
+        try:
+            blocks = self._iter_blocks(reader)
+            if self.mode == ChunkMode.N_EVENTS:
+                yield from self._by_count(blocks)
+            else:
+                yield from self._by_time(blocks)
+        finally:
+            reader.close()
+
+    def _iter_blocks(self, reader: _BlockReader) -> Iterator[np.ndarray]:
+        while not reader.finished():
+            block = reader.read_block(self._block_size)
+            if len(block) == 0:
+                break
+            first = int(np.searchsorted(block["t"], self.start_ts))
+            if first < len(block):
+                yield block[first:]
+
+    def _by_count(self, blocks: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+        pending = None
+        for block in blocks:
+            if pending is not None:
+                # Only the chunk spanning two blocks is copied
+                num_fill = self.n_events - len(pending)
+                pending = np.concatenate((pending, block[:num_fill]))
+                block = block[num_fill:]
+                if len(pending) < self.n_events:
+                    continue
+                yield self._emit(pending)
+            num_full = len(block) // self.n_events * self.n_events
+            for idx in range(0, num_full, self.n_events):
+                yield self._emit(block[idx:idx + self.n_events])
+            pending = block[num_full:] if num_full < len(block) else None
+        if pending is not None:
+            yield self._emit(pending)
+
+    def _by_time(self, blocks: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+        pending = None
+        win_end = self.start_ts + self.delta_t
+        for block in blocks:
+            if pending is not None:
+                # Only the window spanning two blocks is copied
+                split = int(np.searchsorted(block["t"], win_end))
+                pending = np.concatenate((pending, block[:split]))
+                block = block[split:]
+                if len(block) == 0:
+                    continue
+                self._current_time = win_end
+                win_end += self.delta_t
+                yield pending
+            # Every window closed by this block, empty ones included
+            ends = np.arange(win_end, int(block["t"][-1]) + 1, self.delta_t)
+            splits = np.searchsorted(block["t"], ends).tolist()
+            prev = 0
+            for end, split in zip(ends.tolist(), splits):
+                self._current_time = end
+                yield block[prev:split]
+                prev = split
+            win_end += len(ends) * self.delta_t
+            pending = block[prev:]
+        if pending is not None and len(pending) > 0:
+            self._current_time = win_end
+            yield pending
+
+    def _emit(self, chunk: np.ndarray) -> np.ndarray:
+        self._current_time = int(chunk["t"][-1])
+        return chunk
+
+def load_events(fname: str, start_ts: int = 0) -> np.ndarray:
+    # Whole recording as one structured array
+    chunks = EventChunkIterator(fname, ChunkMode.N_EVENTS, n_events=READ_BLOCK_SIZE, start_ts=start_ts)
+    return np.concatenate([np.empty(0, dtype=EVENT2D_DTYPE), *chunks])
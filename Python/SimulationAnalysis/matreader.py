@@ -2,43 +2,47 @@ from typing import Callable
 import h5py
 import numpy as np
 
-from events import Event2d, EventExtTrigger, EventTypes
-
-def _read_Event2d(matfile: h5py.File, idx: int, ts_offs: int) -> Event2d:
-    evt = Event2d(
-        x=matfile.get("x")[0][idx],            # type: ignore
-        y=matfile.get("y")[0][idx],            # type: ignore
-        p=matfile.get("p")[0][idx],            # type: ignore
-        ts=matfile.get("ts")[0][idx] + ts_offs # type: ignore
-    )
-    return evt
-
-def _read_EventExtTrigger(matfile: h5py.File, idx: int, ts_offs: int) -> EventExtTrigger:
-    evt = EventExtTrigger(
-        id=matfile.get("id")[0][idx],                                               # type: ignore
-        pad1=matfile.get("pad1")[0][idx] if matfile.get("pad1") is not None else 0, # type: ignore
-        p=matfile.get("p")[0][idx],                                                 # type: ignore
-        ts=matfile.get("ts")[0][idx] + ts_offs                                      # type: ignore
-    )
-    return evt
+from events import (
+    EVENT2D_DTYPE,
+    EVENT_EXT_TRIGGER_DTYPE,
+    Event2d,
+    Event2dBatch,
+    EventBatch,
+    EventExtTrigger,
+    EventExtTriggerBatch,
+    EventTypes
+)
+
+# Structured array field -> matfile dataset name
+_EVENT2D_FIELDS = {"x": "x", "y": "y", "p": "p", "t": "ts"}
+_EVENT_EXT_TRIGGER_FIELDS = {"id": "id", "p": "p", "t": "ts"}
 
 class MatReader:
-    def __init__(self, fname: str) -> None:
+    CHUNK_SIZE = 65536                  # Events per hyperslab read
+
+    def __init__(self, fname: str, chunk_size: int = CHUNK_SIZE) -> None:
         self._matfile: h5py.File = None # type: ignore
         self._at_eof: bool = False
         self._eof: int = None           # type: ignore
         self._idx: int = 0
-        self._read_single: Callable[[h5py.File, int, int], Event2d | EventExtTrigger] = None # type: ignore
+        self._to_batch: Callable[[np.ndarray], EventBatch] = None # type: ignore
         self._ts_offs = 0
+        self._chunk_size = chunk_size
+        self._buf: np.ndarray = None    # type: ignore
+        self._buf_start: int = 0
 
         self._matfile = h5py.File(fname, "r")
         self._eof, evtype = self._get_fileinfo()
         if evtype in [EventTypes.EVENT_2D, EventTypes.EVENT_CD]:
-            self._read_single = _read_Event2d
+            dtype, fields = EVENT2D_DTYPE, _EVENT2D_FIELDS
+            self._to_batch = Event2dBatch
         elif evtype in [EventTypes.EVENT_EXT_TRIGGER]:
-            self._read_single = _read_EventExtTrigger
+            dtype, fields = EVENT_EXT_TRIGGER_DTYPE, _EVENT_EXT_TRIGGER_FIELDS
+            self._to_batch = EventExtTriggerBatch
         else:
             raise ValueError(f"Unknown event type: {evtype}")
+        self._datasets = {name: self._matfile[key] for name, key in fields.items()}
+        self._buf = np.empty(0, dtype=dtype)
 
     def __enter__(self):
         return self
@@ -47,6 +51,9 @@ class MatReader:
         del exc_type, exc_value, traceback
         self._matfile.close()
 
+    def __len__(self) -> int:
+        return self._eof
+
     def close(self) -> None:
         self._matfile.close()
 
@@ -55,13 +62,19 @@ class MatReader:
 
     def set_pos(self, pos: int) -> None:
         self._idx = pos
+        self._at_eof = self._idx >= self._eof
 
     def read_event(self) -> Event2d | EventExtTrigger:
-        evt, self._idx = self._read_single(self._matfile, self._idx, self._ts_offs)
+        evt = self._to_batch(self._read_num(1))[0]
         return evt
 
-    def read_events(self, lim: int, by_ts: bool = False) -> list[Event2d | EventExtTrigger]:
+    def read_events(self, lim: int, by_ts: bool = False) -> EventBatch:
+        return self._to_batch(self.read_array(lim, by_ts))
+
+    def read_array(self, lim: int, by_ts: bool = False) -> np.ndarray:
         evts = self._read_win(lim) if by_ts else self._read_num(lim)
+        if self._idx >= self._eof:
+            self._at_eof = True
         return evts
 
     def finished(self) -> bool:
@@ -69,49 +82,59 @@ class MatReader:
 
     def reset_read(self) -> None:
         self._idx = 0
+        self._at_eof = False
 
     def set_ts_offset(self, ts_offs: int) -> None:
         self._ts_offs = ts_offs
 
     def _get_fileinfo(self) -> tuple[int, int]:
-        exp_len = len(self._matfile.get("ts")[0]) # type: ignore
+        exp_len = self._matfile["ts"].shape[-1] # type: ignore
         evtype = 0x0C
         for key, val in self._matfile.items():
             if key == "ts":
                 continue
             if key == "id":
                 evtype = 0x0E
-            if len(val[0]) != exp_len:
+            if val.shape[-1] != exp_len:
                 raise ValueError("Invalid matfile. All data fields must have the same length.")
         return exp_len, evtype
 
-    def _read_num(self, num_evts: int) -> list[Event2d | EventExtTrigger]:
-        evts = []
-        for _ in range(num_evts):
-            evt = self._read_single(self._matfile, self._idx, self._ts_offs)
-            evts.append(evt)
-            self._idx += 1
-            if self._idx >= self._eof:
-                self._at_eof = True
-                break
+    def _buffered(self, idx: int) -> np.ndarray:
+        # Read-ahead: serve from the cached hyperslab, loading the next one on a miss
+        buf_end = self._buf_start + len(self._buf)
+        if not self._buf_start <= idx < buf_end:
+            stop = min(idx + self._chunk_size, self._eof)
+            buf = np.empty(stop - idx, dtype=self._buf.dtype)
+            for name, dataset in self._datasets.items():
+                buf[name] = dataset[0, idx:stop]
+            self._buf = buf
+            self._buf_start = idx
+        return self._buf[idx - self._buf_start:]
+
+    def _finalize(self, chunks: list[np.ndarray]) -> np.ndarray:
+        evts = np.concatenate(chunks)
+        evts["t"] += self._ts_offs
         return evts
 
-    def _read_win(self, t_window: int) -> list[Event2d | EventExtTrigger]:
-        evts = []
-        evt = self._read_single(self._matfile, self._idx, self._ts_offs)
-        self._idx += 1
-        print(evt.ts)
-        max_ts = evt.ts + t_window
-        evts.append(evt)
-        while True:
-            evt = self._read_single(self._matfile, self._idx, self._ts_offs)
-            if evt.ts > max_ts:
-                print(f"{evt.ts} > {max_ts}")
-                break
-            evts.append(evt)
-            self._idx += 1
-            if self._idx >= self._eof:
-                print("Eof")
-                self._at_eof = True
+    def _read_num(self, num_evts: int) -> np.ndarray:
+        chunks = [self._buf[:0]]
+        stop = min(self._idx + num_evts, self._eof)
+        while self._idx < stop:
+            chunk = self._buffered(self._idx)[:stop - self._idx]
+            chunks.append(chunk)
+            self._idx += len(chunk)
+        return self._finalize(chunks)
+
+    def _read_win(self, t_window: int) -> np.ndarray:
+        chunks = [self._buf[:0]]
+        max_ts = None
+        while self._idx < self._eof:
+            chunk = self._buffered(self._idx)
+            if max_ts is None:
+                max_ts = chunk["t"][0] + t_window
+            num_in_win = int(np.searchsorted(chunk["t"], max_ts, side="right"))
+            chunks.append(chunk[:num_in_win])
+            self._idx += num_in_win
+            if num_in_win < len(chunk):
                 break
-        return evts
+        return self._finalize(chunks)
@@ -0,0 +1,33 @@
+import argparse
+import os
+import numpy as np
+from datreader import DatReader
+from simmerge import MERGE_CHUNK_SIZE, write_merged_datfile
+
+SIMULATION_40MPH = os.path.join("data", "simulation_snowEvents_40mph.dat")
+BASELINE_40MPH = os.path.join("data", "baseline_backgroundEvents_40mph.dat")
+MERGED_SAVEFILE = os.path.join("data", "merged_snowEvents_40mph.dat")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Overlay looping simulated snow onto baseline events, with ground truth.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--baseline", default=BASELINE_40MPH, help="Baseline .dat file")
+    parser.add_argument("--simulation", default=SIMULATION_40MPH, help="Simulation .dat file")
+    parser.add_argument("--output", default=MERGED_SAVEFILE, help="Merged .dat file")
+    parser.add_argument(
+        "--chunk-size", type=int, default=MERGE_CHUNK_SIZE, help="Events read per iteration")
+    parser.add_argument(
+        "--start-ts", type=int, default=None,
+        help="Timestamp of the first simulation replay (default: first baseline timestamp)")
+    args = parser.parse_args()
+
+    truth_file = args.output.replace(".dat", "_groundTruth.npy")
+    with DatReader(args.baseline) as base_reader, DatReader(args.simulation) as sim_reader:
+        ground_truth = write_merged_datfile(
+            base_reader, sim_reader, args.output, truth_file, args.chunk_size,
+            start_ts=args.start_ts
+        )
+    print(f"Merged {len(ground_truth)} events ({np.count_nonzero(ground_truth)} simulated). "
+          f"Saved to {args.output} and {truth_file}")
@@ -1,7 +1,8 @@
 import argparse
 import os
+import numpy as np
 from datreader import DatReader
-from events import EventFieldBytes
+from eventcache import CachedEventReader, EventCache
 import math
 
 SIMULATION_30MPH = os.path.join("data", "simulation_snowEvents_30mph.dat")
@@ -10,34 +11,67 @@ BASELINE_30MPH = os.path.join("data", "baseline_backgroundEvents_30mph.dat")
 BASELINE_40MPH = os.path.join("data", "baseline_backgroundEvents_40mph.dat")
 
 RESULTS_SAVEFILE = "event_analysis.txt"
+USE_EVENT_CACHE = False                 # Read events through the columnar event cache
+
+BASELINE_CHUNK_SIZE = 1000000           # Baseline events read per iteration
+KEY_ADDR_BITS = 29                      # p | y | x bits, as in the .dat address word
+
+def pack_event_keys(evts: np.ndarray, ts_offs: int = 0) -> np.ndarray:
+    # One sortable int64 per event: (t - ts_offs) in the high bits, .dat address below
+    keys = (evts["t"].astype(np.int64) - ts_offs) << KEY_ADDR_BITS
+    keys |= (evts["p"].astype(np.int64) & 0x0001) << 28
+    keys |= (evts["y"].astype(np.int64) & 0x3FFF) << 14
+    keys |= (evts["x"].astype(np.int64) & 0x3FFF) << 0
+    return keys
+
+def count_matches(base_evts: np.ndarray, sim_keys: np.ndarray, ts_offs: int) -> int:
+    base_keys = pack_event_keys(base_evts, ts_offs)
+    first = np.searchsorted(sim_keys, base_keys.min())
+    last = np.searchsorted(sim_keys, base_keys.max(), side="right")
+    return len(np.intersect1d(base_keys, sim_keys[first:last]))
 
 def get_percent_match(
-    baseline_reader: DatReader,
-    simulation_reader: DatReader,
+    baseline_reader: DatReader | CachedEventReader,
+    simulation_reader: DatReader | CachedEventReader,
     max_time: int = None
-) -> float:
-    total_events = 0
-    total_matches = 0
-    first_done = False
+) -> tuple[float, int]:
+    # The simulation is replayed back to back over the baseline: each replay
+    # starts at the first baseline timestamp after the previous one ended.
+    # The simulation is loaded once and the baseline is streamed once.
     max_time = max_time if max_time is not None else math.inf
-    while not baseline_reader.finished():
-        if first_done:
-            curr_ts = baseline_reader.read_event().ts
-            if curr_ts > max_time:
-                break
-            simulation_reader.set_ts_offset(curr_ts)
-            baseline_reader.set_pos(baseline_reader.pos() - EventFieldBytes.TOTAL)
-        prev_sim_ts = 0
-        while not simulation_reader.finished():
-            sim_evts = simulation_reader.read_events(10000)
-            base_evts = baseline_reader.read_events(sim_evts[-1].ts - prev_sim_ts, by_ts=True)
-            prev_sim_ts = sim_evts[-1].ts
-            total_events += len(sim_evts) + len(base_evts)
-            total_matches += len(set(sim_evts).intersection(set(base_evts)))
-            if prev_sim_ts > max_time:
+    sim_evts = simulation_reader.read_array(len(simulation_reader))
+    if len(sim_evts) == 0:
+        return 0.0, 0
+    sim_ts = np.sort(sim_evts["t"])
+    sim_keys = np.sort(pack_event_keys(sim_evts))
+    sim_end = int(sim_ts[-1])
+
+    ts_offs = 0
+    total_events = int(np.searchsorted(sim_ts, max_time - ts_offs, side="right"))
+    total_matches = 0
+    carry = baseline_reader.read_array(0)
+    done = False
+    while not done:
+        base_evts = np.concatenate((carry, baseline_reader.read_array(BASELINE_CHUNK_SIZE)))
+        done = baseline_reader.finished() or len(base_evts) == len(carry)
+        if len(base_evts) > 0 and base_evts["t"][-1] > max_time:
+            base_evts = base_evts[:np.searchsorted(base_evts["t"], max_time, side="right")]
+            done = True
+        if not done:
+            # Keep the last timestamp together so identical events are never split
+            split = np.searchsorted(base_evts["t"], base_evts["t"][-1])
+            carry = base_evts[split:]
+            base_evts = base_evts[:split]
+        while len(base_evts) > 0:
+            num_in_pass = int(np.searchsorted(base_evts["t"], ts_offs + sim_end, side="right"))
+            if num_in_pass > 0:
+                total_events += num_in_pass
+                total_matches += count_matches(base_evts[:num_in_pass], sim_keys, ts_offs)
+            if num_in_pass == len(base_evts):
                 break
-        first_done = True
-        simulation_reader.reset_read()
+            base_evts = base_evts[num_in_pass:]
+            ts_offs = int(base_evts["t"][0])
+            total_events += int(np.searchsorted(sim_ts, max_time - ts_offs, side="right"))
     return total_matches/total_events, total_events
 
 if __name__ == "__main__":
@@ -56,17 +90,18 @@ if __name__ == "__main__":
     run40 = args.run_40mph or args.run_both
 
     n_sec = int(3.6*1e6)
+    open_events = EventCache().open if USE_EVENT_CACHE else DatReader
     resfile = open(RESULTS_SAVEFILE, "w", encoding="utf-8")
 
     if run30:
-        with DatReader(BASELINE_30MPH) as base_reader:
-            with DatReader(SIMULATION_30MPH) as sim_reader:
+        with open_events(BASELINE_30MPH) as base_reader:
+            with open_events(SIMULATION_30MPH) as sim_reader:
                 percent_match, total_ev = get_percent_match(base_reader, sim_reader, n_sec)
         print(f"30MPH Sequence: {percent_match:.2f}%")
         resfile.write(f"30MPH Sequence: {percent_match:.2f}% match, {total_ev} events analyzed\n")
     if run40:
-        with DatReader(BASELINE_40MPH) as base_reader:
-            with DatReader(SIMULATION_40MPH) as sim_reader:
+        with open_events(BASELINE_40MPH) as base_reader:
+            with open_events(SIMULATION_40MPH) as sim_reader:
                 percent_match, total_ev = get_percent_match(base_reader, sim_reader, n_sec)
         print(f"40MPH Sequence: {percent_match:.2f}%")
         resfile.write(f"40MPH Sequence: {percent_match:.2f}% match, {total_ev} events analyzed\n")
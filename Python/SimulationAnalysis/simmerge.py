@@ -0,0 +1,112 @@
+from typing import Iterator
+import numpy as np
+
+from convertMatfile_main import EVT_DATA, HEADER_DATA, create_datfile_evts
+from datreader import DatReader
+
+MERGE_CHUNK_SIZE = 1000000              # Events read per stream per iteration
+
+def _replay(
+    sim_reader: DatReader,
+    chunk_size: int,
+    period: int | None,
+    start_ts: int
+) -> Iterator[np.ndarray]:
+    # The simulation on a loop from start_ts: every replay is shifted by the
+    # replay period, which defaults to the simulation length (last timestamp + 1)
+    replay = 0
+    while True:
+        ts_offs = start_ts + (replay * period if period is not None else 0)
+        sim_reader.reset_read()
+        sim_reader.set_ts_offset(ts_offs)
+        last_ts = None
+        while not sim_reader.finished():
+            evts = sim_reader.read_array(chunk_size)
+            if len(evts) == 0:
+                break
+            last_ts = int(evts["t"][-1]) - ts_offs
+            yield evts
+        if last_ts is None:
+            return
+        if period is None:
+            period = last_ts + 1
+        replay += 1
+
+def merge_sim_events(
+    base_reader: DatReader,
+    sim_reader: DatReader,
+    chunk_size: int = MERGE_CHUNK_SIZE,
+    period: int | None = None,
+    start_ts: int | None = None
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    # Two-way merge of the baseline and the looping simulation by timestamp.
+    # Yields (events, ground_truth) chunks, ground truth is True for simulated
+    # events. Only the two read buffers are held in memory; the merge ends with
+    # the baseline, and ties keep baseline events first. The first replay is
+    # shifted to start_ts, which defaults to the first baseline timestamp.
+    base_buf = base_reader.read_array(chunk_size)
+    if start_ts is None:
+        start_ts = int(base_buf["t"][0]) if len(base_buf) > 0 else 0
+    sim_chunks = _replay(sim_reader, chunk_size, period, start_ts)
+    sim_buf = base_buf[:0]
+    sim_done = False
+    while True:
+        if len(base_buf) == 0 and not base_reader.finished():
+            base_buf = base_reader.read_array(chunk_size)
+        if len(sim_buf) == 0 and not sim_done:
+            sim_buf = next(sim_chunks, None)
+            sim_done = sim_buf is None
+            sim_buf = base_buf[:0] if sim_done else sim_buf
+        if len(base_buf) == 0:
+            return
+
+        # Everything up to the earlier of the two buffer ends is final
+        cutoff = int(base_buf["t"][-1])
+        if not sim_done:
+            cutoff = min(cutoff, int(sim_buf["t"][-1]))
+        num_base = int(np.searchsorted(base_buf["t"], cutoff, side="right"))
+        num_sim = int(np.searchsorted(sim_buf["t"], cutoff, side="right"))
+
+        evts = np.concatenate((base_buf[:num_base], sim_buf[:num_sim]))
+        ground_truth = np.zeros(len(evts), dtype=bool)
+        ground_truth[num_base:] = True
+        order = np.argsort(evts["t"], kind="stable")
+        base_buf = base_buf[num_base:]
+        sim_buf = sim_buf[num_sim:]
+        yield evts[order], ground_truth[order]
+
+def write_merged_datfile(
+    base_reader: DatReader,
+    sim_reader: DatReader,
+    fname: str,
+    truth_fname: str,
+    chunk_size: int = MERGE_CHUNK_SIZE,
+    period: int | None = None,
+    start_ts: int | None = None
+) -> np.ndarray:
+    # The ground truth is written to the truth_fname .npy chunk by chunk, next
+    # to the events, and returned memory-mapped. Its header is written first and
+    # rewritten with the final length, numpy pads it so that fits in place.
+    header = np.lib.format.header_data_from_array_1_0(np.zeros(0, dtype=bool))
+    num_evts = 0
+    with open(fname, "wb") as datfile, open(truth_fname, "wb") as truthfile:
+        datfile.write(HEADER_DATA.encode("ascii"))
+        datfile.write(EVT_DATA)
+        np.lib.format.write_array_header_1_0(truthfile, header)
+        data_start = truthfile.tell()
+        for evts, truth in merge_sim_events(
+                base_reader, sim_reader, chunk_size, period, start_ts):
+            create_datfile_evts(
+                evts["x"].astype(np.int64),
+                evts["y"].astype(np.int64),
+                evts["p"].astype(np.int64),
+                evts["t"]
+            ).tofile(datfile)
+            truth.tofile(truthfile)
+            num_evts += len(truth)
+        truthfile.seek(0)
+        header["shape"] = (num_evts,)
+        np.lib.format.write_array_header_1_0(truthfile, header)
+        if truthfile.tell() != data_start:
+            raise RuntimeError(f"Ground truth header of {truth_fname} does not fit in place")
+    return np.load(truth_fname, mmap_mode="r")
@@ -0,0 +1,34 @@
+import argparse
+import os
+import time
+from snowmodel import CameraSpecs, SnowModel, SnowSpecs
+
+SIMULATION_SAVEFILE = os.path.join("data", "simulation_snowEvents_{mph}mph.dat")
+
+###############################################################################
+# Settings, replace desired values
+NUM_FLAKES = 500                    # Snow flakes in the scene
+FLAKE_DIAMETER = 3e-3               # Snow flake diameter in m
+MIN_DEPTH = 0.1                     # Minimum detection distance in m
+NUM_WORKERS = os.cpu_count() or 1   # Threads simulating pixels
+###############################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Simulate snow flake events (Python port of SnowModel_v3.m) to a .dat file.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--mph", type=float, default=40, help="Vehicle speed in mph")
+    parser.add_argument("--flakes", type=int, default=NUM_FLAKES, help="Number of snow flakes")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="Simulation threads")
+    parser.add_argument("--output", default=None, help="Output .dat file")
+    args = parser.parse_args()
+
+    savefile = args.output or SIMULATION_SAVEFILE.format(mph=f"{args.mph:g}")
+    snow = SnowSpecs(FLAKE_DIAMETER, args.mph, args.flakes, MIN_DEPTH)
+    start = time.perf_counter()
+    model = SnowModel(CameraSpecs(), snow, args.seed, args.workers)
+    num_evts = model.write_datfile(savefile)
+    print(f"Simulated {num_evts} events from {args.flakes} flakes "
+          f"in {time.perf_counter() - start:.1f}s. Saved to {savefile}")
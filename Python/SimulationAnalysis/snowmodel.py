@@ -0,0 +1,309 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, NamedTuple
+import warnings
+import numpy as np
+from numpy.typing import NDArray
+try:
+    from numba import njit
+    from numba.extending import register_jitable
+except ImportError:
+    njit = None
+    def register_jitable(fn):
+        return fn
+
+from convertMatfile_main import EVT_DATA, HEADER_DATA, create_datfile_evts
+from events import EVENT2D_DTYPE
+
+# Python port of Matlab/SnowModel_v3.m. Every flake is projected with the same
+# Gaussian/log/low-pass/quantizer pipeline, but instead of filtering every pixel
+# of the sensor for every depth sample, each pixel is only simulated over the
+# depth interval where the flake can reach it, which is solved in closed form,
+# and spans of that interval that cannot cross a quantizer step are skipped.
+
+MPH_TO_M_PER_US = 1.609344 / 3.6 * 1e-6
+
+# Pixel pipeline constants, as in SnowModel_v3.m
+PEAK_INTENSITY = 50                     # Gaussian peak intensity
+LOG_OFFSET = 0.3679                     # Added before the log to avoid -inf
+LPF_ALPHA = 0.92                        # Low pass filter pole
+QUANT_GAIN = 1.2                        # Quantizer gain
+RANGE_BAND = 5                          # Pixels kept behind the starting position
+
+# Intensity below which a flake is considered absent from a pixel. The filter
+# state error this introduces is below 1e-3, far from any quantizer step.
+MIN_INTENSITY = 1e-4
+# Samples filtered at the end of a skipped span; the skipped ones weigh less
+# than LPF_ALPHA**512 ~ 3e-19 in the filter output
+LPF_TAPS = 512
+STEP_MARGIN = 1e-9                      # Log level margin kept from quantizer steps when skipping
+# Samples after a flake leaves a pixel for the filter output to drop below the
+# first quantizer step: alpha^n * (log(PEAK + OFFSET) + 1) < 1 / QUANT_GAIN
+DECAY_SAMPLES = int(np.ceil(
+    np.log(1 / QUANT_GAIN / (np.log(PEAK_INTENSITY + LOG_OFFSET) + 1)) / np.log(LPF_ALPHA)))
+
+WINDOW_SIZE = 20000                     # Timestamps simulated per output chunk
+SKIP_SPAN = 4 * LPF_TAPS                # Shortest span tested for skipping
+SKIP_RETRY = 256                        # Samples before testing again after a failed skip
+RESYNC_SAMPLES = 64                     # Samples between exact Gaussian evaluations
+EVENT_BUFFER = 1 << 20                  # Events collected per kernel call
+
+@register_jitable
+def _exponent(x, y, fx, fy, gain, u):
+    # Gaussian exponent d^2 / (0.5 sigma^2) at the pixel, with u = 1 / ratio
+    dist_x, dist_y = x * u - fx, y * u - fy
+    return gain * (dist_x * dist_x + dist_y * dist_y)
+
+@register_jitable
+def _steady(x, y, fx, fy, gain, u_peak, inv_ratio, quant, first, last):
+    # Whether samples [first, last) stay within quantizer step `quant`. The
+    # exponent is a parabola in u, which is linear in the sample index.
+    u_first, u_last = inv_ratio[first], inv_ratio[last - 1]
+    u_near = min(max(u_peak, u_last), u_first)
+    expo_near = _exponent(x, y, fx, fy, gain, u_near)
+    expo_far = max(_exponent(x, y, fx, fy, gain, u_first), _exponent(x, y, fx, fy, gain, u_last))
+    # The filter output is a running average of the log level, so it cannot leave
+    # the step while every input stays inside it
+    high = np.log(PEAK_INTENSITY * np.exp(-expo_near) + LOG_OFFSET) + 1
+    low = np.log(PEAK_INTENSITY * np.exp(-expo_far) + LOG_OFFSET) + 1
+    return (np.floor((low - STEP_MARGIN) * QUANT_GAIN) == quant
+            and np.floor((high + STEP_MARGIN) * QUANT_GAIN) == quant)
+
+def _simulate_kernel(
+    segs, last, seg_x, seg_y, seg_flake, seg_stop, flake_x, flake_y, inv_ratio, step_u, gain,
+    seg_pos, seg_level, seg_quant, out_x, out_y, out_p, out_t
+):
+    # Runs segments from their saved position up to sample `last`, until the event
+    # buffer could overflow. Returns the segments done and the events written.
+    num = 0
+    for i in range(len(segs)):
+        seg = segs[i]
+        stop = min(seg_stop[seg], last)
+        pos = seg_pos[seg]
+        if num + stop - pos > len(out_t):
+            return i, num
+        x, y = float(seg_x[seg]), float(seg_y[seg])
+        fx, fy = flake_x[seg_flake[seg]], flake_y[seg_flake[seg]]
+        norm = x * x + y * y
+        u_peak = (x * fx + y * fy) / norm if norm > 0 else 0.0
+        # The exponent is quadratic in the sample index, so the Gaussian follows
+        # gauss[n+1] = gauss[n] grow[n] with grow[n+1] = grow[n] grow_step
+        grow_step = np.exp(-2 * gain * step_u * step_u * norm)
+        gauss, grow = 0.0, 0.0
+        level, quant = seg_level[seg], seg_quant[seg]
+        check = sync = pos
+        while pos < stop:
+            if pos >= check and stop - pos >= SKIP_SPAN:
+                # Jump over spans that cannot fire, only filtering their last LPF_TAPS
+                # samples: the filter state from before weighs less than alpha^LPF_TAPS
+                span, length = 0, SKIP_SPAN
+                while length <= stop - pos and _steady(
+                        x, y, fx, fy, gain, u_peak, inv_ratio, quant, pos, pos + length):
+                    span, length = length, 2 * length
+                if 0 < span < stop - pos < length and _steady(
+                        x, y, fx, fy, gain, u_peak, inv_ratio, quant, pos, stop):
+                    span = stop - pos
+                if span > 0:
+                    pos += span - LPF_TAPS
+                    check, sync = pos + LPF_TAPS, pos
+                    continue
+                check = pos + SKIP_RETRY
+            if pos >= sync:
+                # Recomputed regularly to bound the rounding drift of the recurrence
+                u = inv_ratio[pos]
+                expo = _exponent(x, y, fx, fy, gain, u)
+                gauss = np.exp(-expo)
+                grow = np.exp(expo - _exponent(x, y, fx, fy, gain, u + step_u))
+                sync = pos + RESYNC_SAMPLES
+
+            # Log and low pass filter y[n] = alpha y[n-1] + (1 - alpha) x[n]
+            intensity = PEAK_INTENSITY * gauss
+            level = LPF_ALPHA * level + (1 - LPF_ALPHA) * (np.log(intensity + LOG_OFFSET) + 1)
+            # Quantizer and comparator; the level is positive, so truncating is floor
+            step = int(level * QUANT_GAIN)
+            if step != quant:
+                out_x[num], out_y[num], out_p[num], out_t[num] = seg_x[seg], seg_y[seg], step > quant, pos
+                num += 1
+                quant = step
+            gauss *= grow
+            grow *= grow_step
+            pos += 1
+        seg_pos[seg], seg_level[seg], seg_quant[seg] = pos, level, quant
+    return len(segs), num
+
+_simulate_kernel_jit = njit(cache=True, nogil=True)(_simulate_kernel) if njit is not None else None
+
+class CameraSpecs(NamedTuple):
+    pixel_size: float = 4.86e-6         # Sensor pixel size, m/pixel
+    width: int = 1280                   # Sensor width, pixels
+    height: int = 720                   # Sensor height, pixels
+    focal_length: float = 5e-3          # Focal length, m
+    distance: float = 10.0              # Object distance, m
+
+class SnowSpecs(NamedTuple):
+    diameter: float = 3e-3              # Flake diameter, m
+    speed_mph: float = 40.0             # Vehicle speed, mph
+    num_flakes: int = 500               # Flakes in the scene
+    min_depth: float = 0.1              # Minimum detection distance, m
+
+class _Segments(NamedTuple):
+    flake: NDArray[np.int64]
+    x: NDArray[np.int64]
+    y: NDArray[np.int64]
+    start: NDArray[np.int64]
+    stop: NDArray[np.int64]
+
+class _FilterState(NamedTuple):
+    # Per segment, carried across windows
+    pos: NDArray[np.int64]              # Next sample to simulate
+    level: NDArray[np.float64]          # Low pass filter output
+    quant: NDArray[np.int64]            # Quantizer output
+
+class SnowModel:
+    def __init__(
+        self,
+        camera: CameraSpecs = CameraSpecs(),
+        snow: SnowSpecs = SnowSpecs(),
+        seed: int | None = None,
+        num_workers: int = 1
+    ) -> None:
+        self.camera = camera
+        self.snow = snow
+        self.num_workers = max(num_workers, 1)
+        self._kernel = _simulate_kernel_jit or _simulate_kernel
+        if _simulate_kernel_jit is None:
+            warnings.warn("numba is not installed, the snow simulation runs in pure Python")
+        self.speed = snow.speed_mph * MPH_TO_M_PER_US
+        self.scale = camera.focal_length / camera.pixel_size
+        self.half_w = camera.width // 2
+        self.half_h = camera.height // 2
+
+        # Flake positions on the object plane
+        rng = np.random.default_rng(seed)
+        obj_w = camera.distance / camera.focal_length * camera.pixel_size * camera.width
+        obj_h = camera.distance / camera.focal_length * camera.pixel_size * camera.height
+        self.flake_x = obj_w * (rng.random(snow.num_flakes) - 0.5)
+        self.flake_y = obj_h * (rng.random(snow.num_flakes) - 0.5)
+
+        # Depth range Dt = Z:-V:min_depth, one sample per microsecond
+        num_depths = int(np.floor((camera.distance - snow.min_depth) / self.speed)) + 1
+        depths = camera.distance - np.arange(num_depths) * self.speed
+        self._inv_ratio = depths / self.scale
+
+        # Samples until each flake leaves the sensor (LastT)
+        neg_depths = -depths
+        last_x = np.searchsorted(neg_depths, -np.abs(self.flake_x) * self.scale / self.half_w)
+        last_y = np.searchsorted(neg_depths, -np.abs(self.flake_y) * self.scale / self.half_h)
+        self.last_t = np.minimum(last_x, last_y)
+        self.duration = int(self.last_t.max(initial=0))
+        self._segments = self._find_segments(depths)
+
+    def _find_segments(self, depths: NDArray[np.float64]) -> _Segments:
+        # A flake at depth s is at (fx, fy) * scale / s with sigma = diameter * scale / s, so
+        # intensity >= MIN_INTENSITY at pixel (x, y) is a quadratic inequality in s:
+        #   (x^2 + y^2) s^2 - 2 scale (x fx + y fy) s + scale^2 (fx^2 + fy^2 - (c diameter)^2) <= 0
+        reach = np.sqrt(0.5 * np.log(PEAK_INTENSITY / MIN_INTENSITY)) * self.snow.diameter
+        dist = self.camera.distance
+        parts: list[tuple[NDArray[np.int64], ...]] = []
+        for flake in np.flatnonzero(self.last_t > 1):
+            fx, fy = self.flake_x[flake], self.flake_y[flake]
+            end_depth = depths[self.last_t[flake] - 1]
+            radius = reach * self.scale / end_depth
+
+            # Matlab's active region, trimmed to the flake's path and to the sensor
+            # (Matlab spans -640..640, one column more than the sensor has)
+            x0, y0 = fx * self.scale / dist, fy * self.scale / dist
+            x1, y1 = fx * self.scale / end_depth, fy * self.scale / end_depth
+            xlim = (np.floor(x0) - np.sign(x0) * RANGE_BAND, np.sign(x0) * self.half_w)
+            ylim = (np.floor(y0) - np.sign(y0) * RANGE_BAND, np.sign(y0) * self.half_h)
+            x_edge = self.camera.width - self.half_w - 1
+            y_edge = self.camera.height - self.half_h - 1
+            xmin = int(max(min(xlim), np.floor(min(x0, x1) - radius), -self.half_w))
+            xmax = int(min(max(xlim), np.ceil(max(x0, x1) + radius), x_edge))
+            ymin = int(max(min(ylim), np.floor(min(y0, y1) - radius), -self.half_h))
+            ymax = int(min(max(ylim), np.ceil(max(y0, y1) + radius), y_edge))
+            xs, ys = np.meshgrid(np.arange(xmin, xmax + 1), np.arange(ymin, ymax + 1))
+            xs, ys = xs.ravel(), ys.ravel()
+
+            quad_a = (xs * xs + ys * ys).astype(np.float64)
+            quad_b = self.scale * (xs * fx + ys * fy)
+            quad_c = self.scale**2 * (fx * fx + fy * fy - reach * reach)
+            disc = quad_b * quad_b - quad_a * quad_c
+            centre = quad_a == 0
+            hit = np.where(centre, quad_c <= 0, disc >= 0)
+            root = np.sqrt(np.maximum(disc, 0))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                near = np.where(centre, dist, (quad_b + root) / quad_a)
+                far = np.where(centre, 0, (quad_b - root) / quad_a)
+
+            # Depth interval to sample indices, padded by one sample for rounding
+            # and extended by the filter decay once the flake has passed
+            start = np.maximum(np.floor((dist - near) / self.speed) - 1, 0)
+            stop = np.ceil((dist - far) / self.speed) + 2 + DECAY_SAMPLES
+            start = start.astype(np.int64)
+            stop = np.minimum(stop, self.last_t[flake]).astype(np.int64)
+            keep = hit & (near > 0) & (stop > start)
+            parts.append((
+                np.full(np.count_nonzero(keep), flake), xs[keep], ys[keep], start[keep], stop[keep]
+            ))
+
+        if len(parts) == 0:
+            return _Segments(*(np.empty(0, dtype=np.int64) for _ in range(5)))
+        segments = _Segments(*(np.concatenate(col).astype(np.int64) for col in zip(*parts)))
+        order = np.argsort(segments.start, kind="stable")
+        return _Segments(*(col[order] for col in segments))
+
+    def _run_segments(self, segs: NDArray[np.int64], last: int, state: _FilterState) -> NDArray:
+        # Events of the given segments up to sample `last`, in segment order
+        out_x, out_y, out_t = (np.empty(EVENT_BUFFER, dtype=np.int64) for _ in range(3))
+        out_p = np.empty(EVENT_BUFFER, dtype=bool)
+        chunks = [np.empty(0, dtype=EVENT2D_DTYPE)]
+        while len(segs) > 0:
+            done, num = self._kernel(
+                segs, last, self._segments.x, self._segments.y, self._segments.flake,
+                self._segments.stop, self.flake_x, self.flake_y, self._inv_ratio,
+                -self.speed / self.scale, 2 / self.snow.diameter**2,
+                state.pos, state.level, state.quant, out_x, out_y, out_p, out_t
+            )
+            evts = np.empty(num, dtype=EVENT2D_DTYPE)
+            evts["x"] = out_x[:num] + self.half_w
+            evts["y"] = out_y[:num] + self.half_h
+            evts["p"] = out_p[:num]
+            evts["t"] = out_t[:num]
+            chunks.append(evts)
+            segs = segs[done:]
+        return np.concatenate(chunks)
+
+    def iter_events(self, window_size: int = WINDOW_SIZE) -> Iterator[NDArray]:
+        # Segments are independent, so each worker runs a contiguous share of them
+        # with the GIL released; the output does not depend on the worker count.
+        segs = self._segments
+        state = _FilterState(
+            segs.start.copy(), np.zeros(len(segs.start)), np.zeros(len(segs.start), dtype=np.int64))
+        live = np.empty(0, dtype=np.int64)
+        with ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+            for first in range(0, self.duration, window_size):
+                last = first + window_size
+                began = np.arange(*np.searchsorted(segs.start, [first, last]))
+                live = np.concatenate((live[state.pos[live] < segs.stop[live]], began))
+                parts = np.array_split(live, self.num_workers)
+                runs = [pool.submit(self._run_segments, part, last, state) for part in parts]
+                evts = np.concatenate([run.result() for run in runs])
+                yield evts[np.argsort(evts["t"], kind="stable")]
+
+    def events(self) -> NDArray:
+        return np.concatenate([*self.iter_events(), np.empty(0, dtype=EVENT2D_DTYPE)])
+
+    def write_datfile(self, fname: str, window_size: int = WINDOW_SIZE) -> int:
+        num_evts = 0
+        with open(fname, "wb") as datfile:
+            datfile.write(HEADER_DATA.encode("ascii"))
+            datfile.write(EVT_DATA)
+            for evts in self.iter_events(window_size):
+                create_datfile_evts(
+                    evts["x"].astype(np.int64),
+                    evts["y"].astype(np.int64),
+                    evts["p"].astype(np.int64),
+                    evts["t"]
+                ).tofile(datfile)
+                num_evts += len(evts)
+        return num_evts
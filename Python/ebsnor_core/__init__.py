@@ -0,0 +1,10 @@
+# Event-Based Snow Removal (EBSnoR) filter core, without Metavision SDK dependencies
+from .ebsnor_filter import (
+    NO_TIMESTAMP,
+    Backend,
+    CameraDims,
+    EBSnoRFilter,
+    FilterWindows,
+    TileBounds,
+    TimeWidths
+)
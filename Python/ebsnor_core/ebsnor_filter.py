@@ -0,0 +1,765 @@
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Iterator, List, NamedTuple, Sequence, Tuple
+import warnings
+import numpy as np
+from numpy.typing import NDArray
+try:
+    from numba import njit
+    from numba.extending import register_jitable
+except ImportError:
+    njit = None
+    def register_jitable(fn):
+        return fn
+
+class CameraDims(NamedTuple):
+    width: int
+    height: int
+
+class FilterWindows(NamedTuple):
+    time_win: int
+    spatial_win: int
+
+class Backend(Enum):
+    PYTHON = "python"
+    NUMBA = "numba"
+
+# Pixel states hold int32 timestamps relative to a moving origin. They stay in
+# [NO_TIMESTAMP, TS_SPAN), so a difference of two of them always fits in int32.
+NO_TIMESTAMP = np.iinfo(np.int32).min // 2  # Relative timestamp of a pixel that has not fired yet
+TS_SPAN = -NO_TIMESTAMP                     # Relative timestamps covered before rebasing
+NEIGHBOUR_BLOCK = 8                         # Pixels per side of a block-max cell
+SPARSE_RESET_RATIO = 32                      # Reset single pixels when events < pixels / ratio
+
+class TileBounds(NamedTuple):
+    x0: int
+    x1: int
+    y0: int
+    y1: int
+
+class TimeWidths(NamedTuple):
+    spatial_win: NDArray[np.float64]    # IE + TE, spatial window
+    no_ie: NDArray[np.float64]          # No IE filter, per pixel
+    no_lbl_prop: NDArray[np.float64]    # IE only (no label propagation), per pixel
+    per_pixel: NDArray[np.float64]      # IE + TE, per pixel
+    adaptive_win: NDArray[np.float64]   # IE + TE, adaptive window
+
+def _shift_ts(ts: NDArray[np.int32], shift: int) -> NDArray[np.bool]:
+    # Move relative timestamps back by `shift`, clamping the ones that fall out
+    # of range to NO_TIMESTAMP. Returns where they fell out.
+    shifted = ts.astype(np.int64) - shift
+    stale = shifted < NO_TIMESTAMP
+    np.copyto(ts, np.maximum(shifted, NO_TIMESTAMP), casting="unsafe")
+    return stale
+
+class _IEState:
+    # Per-pixel IE/TE chains. Event indices stay int64: streams can run past 2**31 events
+    def __init__(self, dimensions: CameraDims) -> None:
+        shape = (dimensions.width, dimensions.height)
+        self.ie_idx = np.empty(shape, dtype=np.int64)
+        self.prev_ts = np.empty(shape, dtype=np.int32)
+        self.prev_p = np.empty(shape, dtype=np.int8)
+        self.te_count = np.empty(shape, dtype=np.uint8)
+        self.te_tail = np.empty(shape, dtype=np.int64)
+        self.ts_origin: int | None = None
+        self.reset()
+
+    def rebase(self, origin: int) -> None:
+        # Pixels that fell out of range are older than any time window
+        if self.ts_origin is not None:
+            _shift_ts(self.prev_ts, origin - self.ts_origin)
+        self.ts_origin = origin
+
+    def reset(self) -> None:
+        self.ts_origin = None
+        self.ie_idx.fill(-1)
+        self.prev_ts.fill(NO_TIMESTAMP)
+        self.prev_p.fill(0)
+        self.te_count.fill(0)
+        self.te_tail.fill(-1)
+
+    def clear(self, xs: NDArray, ys: NDArray) -> None:
+        # Reset after a pass over events at (xs, ys), only touching their pixels when few
+        if len(xs) * SPARSE_RESET_RATIO > self.prev_ts.size:
+            self.reset()
+            return
+        self.ts_origin = None
+        self.ie_idx[xs, ys] = -1
+        self.prev_ts[xs, ys] = NO_TIMESTAMP
+        self.prev_p[xs, ys] = 0
+        self.te_count[xs, ys] = 0
+        self.te_tail[xs, ys] = -1
+
+class _SnowState:
+    # Last positive IE per (padded) pixel. chain_snow, whether the current IE
+    # chain of a pixel is snow, is only needed when the IE and snow passes are
+    # interleaved; otherwise every TE is already linked when the chain is marked.
+    def __init__(self, dimensions: CameraDims, spatial_window: int, track_chains: bool = False) -> None:
+        padded = (dimensions.width + 2 * spatial_window, dimensions.height + 2 * spatial_window)
+        self.spatial_window = spatial_window
+        self.pos_ts = np.empty(padded, dtype=np.int32)
+        self.pos_idx = np.empty(padded, dtype=np.int64)
+        # Newest positive IE timestamp per NEIGHBOUR_BLOCK x NEIGHBOUR_BLOCK block of pos_ts
+        blocks = (-(-padded[0] // NEIGHBOUR_BLOCK), -(-padded[1] // NEIGHBOUR_BLOCK))
+        self.blk_ts = np.empty(blocks, dtype=np.int32)
+        chain_shape = (dimensions.width, dimensions.height) if track_chains else (0, 0)
+        self.chain_snow = np.empty(chain_shape, dtype=bool)
+        self.ts_origin: int | None = None
+        self.reset()
+
+    def rebase(self, origin: int) -> None:
+        # Pixels that fell out of range count as not fired
+        if self.ts_origin is not None:
+            shift = origin - self.ts_origin
+            self.pos_idx[_shift_ts(self.pos_ts, shift)] = -1
+            _shift_ts(self.blk_ts, shift)
+        self.ts_origin = origin
+
+    def reset(self) -> None:
+        self.ts_origin = None
+        self.pos_ts.fill(NO_TIMESTAMP)
+        self.pos_idx.fill(-1)
+        self.blk_ts.fill(NO_TIMESTAMP)
+        self.chain_snow.fill(False)
+
+    def clear(self, xs: NDArray, ys: NDArray) -> None:
+        # Reset after a pass over events at (xs, ys), only touching their pixels when few
+        if len(xs) * SPARSE_RESET_RATIO > self.pos_ts.size:
+            self.reset()
+            return
+        self.ts_origin = None
+        pad_xs = xs.astype(np.intp) + self.spatial_window
+        pad_ys = ys.astype(np.intp) + self.spatial_window
+        self.pos_ts[pad_xs, pad_ys] = NO_TIMESTAMP
+        self.pos_idx[pad_xs, pad_ys] = -1
+        self.blk_ts[pad_xs // NEIGHBOUR_BLOCK, pad_ys // NEIGHBOUR_BLOCK] = NO_TIMESTAMP
+        if self.chain_snow.size > 0:
+            self.chain_snow[xs, ys] = False
+
+class _StreamTile:
+    # Pixel states of one process_stream() tile, plus the IE/TE chains and snow
+    # labels of its held-back events. `pos` is each event's position in the
+    # filter's held-back buffer; `base` is the global index of the first one.
+    def __init__(self, dimensions: CameraDims, spatial_window: int) -> None:
+        self.ie_state = _IEState(dimensions)
+        self.snow_state = _SnowState(dimensions, spatial_window, track_chains=True)
+        self.pos = np.zeros(0, dtype=np.intp)
+        self.is_ie = np.zeros(0, dtype=bool)
+        self.te_next = -1*np.ones(0, dtype=np.int32)
+        self.is_snow = np.zeros(0, dtype=bool)
+        self.base = 0
+
+    def extend(self, pos: NDArray[np.intp]) -> None:
+        self.pos = np.concatenate((self.pos, pos))
+        self.is_ie = np.concatenate((self.is_ie, np.zeros(len(pos), dtype=bool)))
+        self.te_next = np.concatenate((self.te_next, -1*np.ones(len(pos), dtype=np.int32)))
+        self.is_snow = np.concatenate((self.is_snow, np.zeros(len(pos), dtype=bool)))
+
+    def drop(self, num_final: int) -> None:
+        # Drop the events before buffer position num_final, which are final
+        num_done = int(np.searchsorted(self.pos, num_final))
+        self.pos = self.pos[num_done:] - num_final
+        self.is_ie = self.is_ie[num_done:]
+        # Links only point forward, so the kept suffix just needs rebasing
+        self.te_next = self.te_next[num_done:]
+        self.te_next[self.te_next >= 0] -= num_done
+        self.is_snow = self.is_snow[num_done:]
+        self.base += num_done
+
+    def reset(self) -> None:
+        self.ie_state.reset()
+        self.snow_state.reset()
+        self.pos = self.pos[:0]
+        self.is_ie = self.is_ie[:0]
+        self.te_next = self.te_next[:0]
+        self.is_snow = self.is_snow[:0]
+        self.base = 0
+
+# Stands in for ie_idx/chain_snow when chains are not tracked
+_NO_CHAINS = np.zeros((0, 0), dtype=bool)
+_NO_IE_IDX = np.zeros((0, 0), dtype=np.int64)
+
+def _relative_runs(
+    ts: NDArray,
+    states: Sequence[_IEState | _SnowState]
+) -> Iterator[Tuple[int, int, NDArray[np.int32]]]:
+    # Split time-ordered timestamps into (lo, hi, relative timestamps) runs
+    # that fit the int32 pixel states, rebasing the states before a new run
+    lo = 0
+    while lo < len(ts):
+        origin = states[0].ts_origin
+        if origin is None or ts[lo] - origin >= TS_SPAN:
+            origin = int(ts[lo])
+            for state in states:
+                state.rebase(origin)
+        hi = lo + int(np.searchsorted(ts[lo:], origin + TS_SPAN))
+        yield lo, hi, (ts[lo:hi] - origin).astype(np.int32)
+        lo = hi
+
+def _ie_kernel(
+    xs: NDArray, ys: NDArray, ps: NDArray, ts: NDArray,
+    start: int, base: int, time_window: int, te_depth: int,
+    ie_idx: NDArray, prev_ts: NDArray, prev_p: NDArray, te_count: NDArray, te_tail: NDArray,
+    chain_snow: NDArray, is_ie: NDArray, te_next: NDArray, is_snow: NDArray
+) -> None:
+    # Each IE and its TEs form a linked list through te_next (local indices,
+    # -1 terminated). The per-pixel grids hold global indices (base + local),
+    # so that chains started in an earlier slice stay valid after the buffer shifts.
+    # chain_snow is empty when the snow pass runs afterwards over linked chains.
+    track_chains = chain_snow.shape[0] > 0
+    for k in range(len(ts)):
+        xval = xs[k]
+        yval = ys[k]
+        pval = ps[k]
+        tval = ts[k]
+        idx = start + k
+        if pval != prev_p[xval, yval] or tval - prev_ts[xval, yval] > time_window:
+            is_ie[idx] = True
+            ie_idx[xval, yval] = base + idx
+            te_count[xval, yval] = 0
+            te_tail[xval, yval] = base + idx
+            if track_chains:
+                chain_snow[xval, yval] = False
+        else:
+            if te_count[xval, yval] >= te_depth:
+                continue
+            tail = te_tail[xval, yval] - base
+            if tail >= 0:
+                te_next[tail] = idx
+            te_tail[xval, yval] = base + idx
+            te_count[xval, yval] += 1
+            if track_chains and chain_snow[xval, yval]:
+                is_snow[idx] = True
+        prev_ts[xval, yval] = tval
+        prev_p[xval, yval] = pval
+
+@register_jitable
+def _mark_chain(
+    ie: int, xval: int, yval: int, base: int,
+    ie_idx: NDArray, chain_snow: NDArray, te_next: NDArray, is_snow: NDArray
+) -> None:
+    te = ie - base
+    while te >= 0:
+        is_snow[te] = True
+        te = te_next[te]
+    if chain_snow.shape[0] > 0 and ie_idx[xval, yval] == ie:
+        chain_snow[xval, yval] = True
+
+@register_jitable
+def _mark_window(
+    xval: int, yval: int, tval: int, base: int, time_window: int, spatial_window: int,
+    pos_ts: NDArray, pos_idx: NDArray, blk_ts: NDArray,
+    ie_idx: NDArray, chain_snow: NDArray, te_next: NDArray, is_snow: NDArray
+) -> bool:
+    # Mark every positive IE less than time_window old in the (2w+1)^2 window
+    # around the padded pixel (xval, yval). Blocks whose newest positive IE is
+    # already out of range are skipped without reading their pixels.
+    in_range = False
+    x_lo = xval - spatial_window
+    x_hi = xval + spatial_window + 1
+    y_lo = yval - spatial_window
+    y_hi = yval + spatial_window + 1
+    for bx in range(x_lo // NEIGHBOUR_BLOCK, (x_hi - 1) // NEIGHBOUR_BLOCK + 1):
+        bx_lo = max(x_lo, bx * NEIGHBOUR_BLOCK)
+        bx_hi = min(x_hi, (bx + 1) * NEIGHBOUR_BLOCK)
+        for by in range(y_lo // NEIGHBOUR_BLOCK, (y_hi - 1) // NEIGHBOUR_BLOCK + 1):
+            if tval - blk_ts[bx, by] >= time_window:
+                continue
+            by_lo = max(y_lo, by * NEIGHBOUR_BLOCK)
+            by_hi = min(y_hi, (by + 1) * NEIGHBOUR_BLOCK)
+            for px in range(bx_lo, bx_hi):
+                for py in range(by_lo, by_hi):
+                    if tval - pos_ts[px, py] < time_window:
+                        in_range = True
+                        _mark_chain(
+                            pos_idx[px, py],
+                            px - spatial_window,
+                            py - spatial_window,
+                            base,
+                            ie_idx,
+                            chain_snow,
+                            te_next,
+                            is_snow
+                        )
+    return in_range
+
+def _snow_kernel(
+    xs: NDArray, ys: NDArray, ps: NDArray, ts: NDArray,
+    start: int, base: int, time_window: int, spatial_window: int, adaptive_window: bool,
+    pos_ts: NDArray, pos_idx: NDArray, blk_ts: NDArray, ie_idx: NDArray, chain_snow: NDArray,
+    is_ie: NDArray, te_next: NDArray, is_snow: NDArray
+) -> None:
+    for k in range(len(ts)):
+        idx = start + k
+        if not is_ie[idx]:
+            continue
+        xval = int(xs[k]) + spatial_window
+        yval = int(ys[k]) + spatial_window
+        tval = ts[k]
+        if ps[k] > 0:
+            pos_idx[xval, yval] = base + idx
+            pos_ts[xval, yval] = tval
+            bx = xval // NEIGHBOUR_BLOCK
+            by = yval // NEIGHBOUR_BLOCK
+            blk_ts[bx, by] = max(blk_ts[bx, by], tval)
+            continue
+        in_range = False
+        if adaptive_window and tval - pos_ts[xval, yval] < time_window:
+            in_range = True
+            _mark_chain(
+                pos_idx[xval, yval], xs[k], ys[k], base, ie_idx, chain_snow, te_next, is_snow
+            )
+        else:
+            in_range = _mark_window(
+                xval, yval, tval, base, time_window, spatial_window,
+                pos_ts, pos_idx, blk_ts, ie_idx, chain_snow, te_next, is_snow
+            )
+        if in_range:
+            _mark_chain(base + idx, xs[k], ys[k], base, ie_idx, chain_snow, te_next, is_snow)
+
+def _twidth_kernel(
+    xs: NDArray, ys: NDArray, ps: NDArray, ts: NDArray,
+    start: int, time_window: int, spatial_window: int, max_width: int, is_ie: NDArray,
+    pos_ts: NDArray, pos_idx: NDArray, blk_ts: NDArray, raw_ts: NDArray, raw_idx: NDArray,
+    spatial_win: NDArray, no_ie: NDArray, per_pixel: NDArray, adaptive_win: NDArray
+) -> None:
+    # Time width of a snow pair: negative IE time - positive IE time. Every
+    # event keeps the smallest width it was paired with (inf if never paired),
+    # pairs at least max_width apart are ignored.
+    for j in range(len(ts)):
+        k = start + j
+        tval = ts[j]
+
+        # No IE filter: every event pairs with the last positive event of its pixel
+        if ps[j] > 0:
+            raw_idx[xs[j], ys[j]] = k
+            raw_ts[xs[j], ys[j]] = tval
+        elif raw_idx[xs[j], ys[j]] >= 0 and tval - raw_ts[xs[j], ys[j]] < max_width:
+            width = tval - raw_ts[xs[j], ys[j]]
+            no_ie[k] = width
+            no_ie[raw_idx[xs[j], ys[j]]] = min(no_ie[raw_idx[xs[j], ys[j]]], width)
+
+        if not is_ie[k]:
+            continue
+        xval = int(xs[j]) + spatial_window
+        yval = int(ys[j]) + spatial_window
+        if ps[j] > 0:
+            pos_idx[xval, yval] = k
+            pos_ts[xval, yval] = tval
+            bx = xval // NEIGHBOUR_BLOCK
+            by = yval // NEIGHBOUR_BLOCK
+            blk_ts[bx, by] = max(blk_ts[bx, by], tval)
+            continue
+
+        # Same pixel only
+        centre = pos_idx[xval, yval]
+        if centre >= 0 and tval - pos_ts[xval, yval] < max_width:
+            width = tval - pos_ts[xval, yval]
+            per_pixel[k] = width
+            per_pixel[centre] = min(per_pixel[centre], width)
+
+        # Spatial window, and the adaptive window when the same pixel is out of
+        # range. Blocks without a positive IE newer than max_width are skipped.
+        use_centre = centre >= 0 and tval - pos_ts[xval, yval] < time_window
+        if use_centre:
+            adaptive_win[k] = per_pixel[k]
+            adaptive_win[centre] = min(adaptive_win[centre], per_pixel[k])
+        x_lo = xval - spatial_window
+        x_hi = xval + spatial_window + 1
+        y_lo = yval - spatial_window
+        y_hi = yval + spatial_window + 1
+        for bx in range(x_lo // NEIGHBOUR_BLOCK, (x_hi - 1) // NEIGHBOUR_BLOCK + 1):
+            bx_lo = max(x_lo, bx * NEIGHBOUR_BLOCK)
+            bx_hi = min(x_hi, (bx + 1) * NEIGHBOUR_BLOCK)
+            for by in range(y_lo // NEIGHBOUR_BLOCK, (y_hi - 1) // NEIGHBOUR_BLOCK + 1):
+                if tval - blk_ts[bx, by] >= max_width:
+                    continue
+                by_lo = max(y_lo, by * NEIGHBOUR_BLOCK)
+                by_hi = min(y_hi, (by + 1) * NEIGHBOUR_BLOCK)
+                for px in range(bx_lo, bx_hi):
+                    for py in range(by_lo, by_hi):
+                        part = pos_idx[px, py]
+                        if part < 0 or tval - pos_ts[px, py] >= max_width:
+                            continue
+                        width = tval - pos_ts[px, py]
+                        spatial_win[k] = min(spatial_win[k], width)
+                        spatial_win[part] = min(spatial_win[part], width)
+                        if not use_centre:
+                            adaptive_win[k] = min(adaptive_win[k], width)
+                            adaptive_win[part] = min(adaptive_win[part], width)
+
+def _te_width_kernel(
+    is_ie: NDArray, te_next: NDArray,
+    spatial_win: NDArray, per_pixel: NDArray, adaptive_win: NDArray
+) -> None:
+    # Trailing events take the width of their IE
+    for k in range(len(is_ie)):
+        if not is_ie[k]:
+            continue
+        te = te_next[k]
+        while te >= 0:
+            spatial_win[te] = spatial_win[k]
+            per_pixel[te] = per_pixel[k]
+            adaptive_win[te] = adaptive_win[k]
+            te = te_next[te]
+
+if njit is not None:
+    _ie_kernel_jit = njit(cache=True, nogil=True)(_ie_kernel)
+    _snow_kernel_jit = njit(cache=True, nogil=True)(_snow_kernel)
+    _twidth_kernel_jit = njit(cache=True, nogil=True)(_twidth_kernel)
+    _te_width_kernel_jit = njit(cache=True, nogil=True)(_te_width_kernel)
+
+class EBSnoRFilter:
+    IE_TIME_WINDOW = 10000
+    TE_DEPTH = 10
+
+    def __init__(
+        self,
+        dimensions: CameraDims,
+        windows: FilterWindows,
+        backend: Backend | str = Backend.PYTHON,
+        num_workers: int = 1,
+        tile_grid: Tuple[int, int] | None = None
+    ) -> None:
+        self.time_window = windows.time_win
+        self.spatial_window = windows.spatial_win
+        self.cam_x = dimensions.width
+        self.cam_y = dimensions.height
+        self.num_workers = num_workers
+        self.tiles = self._make_tiles(tile_grid if tile_grid is not None else (num_workers, 1))
+
+        self.backend = Backend(backend)
+        if self.backend == Backend.NUMBA and njit is None:
+            warnings.warn("numba is not installed, falling back to the Python EBSnoR backend")
+            self.backend = Backend.PYTHON
+        if self.backend == Backend.NUMBA:
+            self._ie_kernel = _ie_kernel_jit
+            self._snow_kernel = _snow_kernel_jit
+            self._twidth_kernel = _twidth_kernel_jit
+            self._te_width_kernel = _te_width_kernel_jit
+        else:
+            self._ie_kernel = _ie_kernel
+            self._snow_kernel = _snow_kernel
+            self._twidth_kernel = _twidth_kernel
+            self._te_width_kernel = _te_width_kernel
+
+        # Batch pixel states, allocated on first use and cleared after every call, so
+        # small batches do not pay for a full sensor allocation. Batch calls on one
+        # filter must therefore not run concurrently.
+        self._batch_ie: _IEState = None # type: ignore
+        self._batch_snow: _SnowState = None # type: ignore
+        self._tile_states: List[Tuple[_IEState, _SnowState]] = [None] * len(self.tiles) # type: ignore
+
+        # Streaming state, allocated per tile on the first process_stream() call
+        self._stream_tiles: List[_StreamTile] = [None] * len(self.tiles) # type: ignore
+        self._buf_events: Any = None
+
+        # Tiles run on one pool for the lifetime of the filter, see close()
+        self._pool = None
+        if len(self.tiles) > 1:
+            self._pool = ThreadPoolExecutor(max_workers=num_workers)
+
+    def ie_filter(
+        self,
+        events: Any,
+        time_window: int = 10000,
+        te_depth: int = 10
+    ) -> Tuple[NDArray[np.bool], NDArray[np.int32]]:
+        datalen = len(events["t"])
+        self._check_coords(events)
+        if self._batch_ie is None:
+            self._batch_ie = _IEState(CameraDims(self.cam_x, self.cam_y))
+        state = self._batch_ie
+        is_ie = np.zeros(datalen, dtype=bool)
+        te_next = -1*np.ones(datalen, dtype=np.int32)
+        is_snow = np.zeros(datalen, dtype=bool)
+        if te_depth > np.iinfo(state.te_count.dtype).max:
+            raise ValueError(f"TE depth too large: {te_depth}")
+
+        try:
+            for lo, hi, ts in _relative_runs(events["t"], [state]):
+                self._ie_kernel(
+                    events["x"][lo:hi], events["y"][lo:hi], events["p"][lo:hi], ts,
+                    lo, 0, time_window, te_depth,
+                    state.ie_idx, state.prev_ts, state.prev_p, state.te_count, state.te_tail,
+                    _NO_CHAINS, is_ie, te_next, is_snow
+                )
+        finally:
+            state.clear(events["x"], events["y"])
+        return is_ie, te_next
+
+    def ebsnor_filter(
+        self,
+        events: Any,
+        is_ie: NDArray[np.bool],
+        te_next: NDArray[np.int32],
+        adaptive_window: bool = False
+    ) -> NDArray[np.bool]:
+        datalen = len(events["t"])
+        self._check_coords(events)
+        if self._batch_snow is None:
+            self._batch_snow = _SnowState(CameraDims(self.cam_x, self.cam_y), self.spatial_window)
+        state = self._batch_snow
+        is_snow = np.zeros(datalen, dtype=bool)
+
+        try:
+            for lo, hi, ts in _relative_runs(events["t"], [state]):
+                self._snow_kernel(
+                    events["x"][lo:hi], events["y"][lo:hi], events["p"][lo:hi], ts,
+                    lo, 0, self.time_window, self.spatial_window, adaptive_window,
+                    state.pos_ts, state.pos_idx, state.blk_ts, _NO_IE_IDX, state.chain_snow,
+                    is_ie, te_next, is_snow
+                )
+        finally:
+            state.clear(events["x"], events["y"])
+        return is_snow
+
+    def time_widths(self, events: Any, max_width: int | None = None) -> TimeWidths:
+        """Return the EBSnoR time widths of every ablation variant.
+
+        An event is snow when its width is below the time window, so
+        `time_widths(events).spatial_win < time_win` matches `snow_mask()`.
+        All variants share one IE/TE pass and one pass over the events.
+        Pairs at least `max_width` apart are left out (inf), which lets the
+        spatial window search skip stale blocks; widths below it are exact.
+        """
+        datalen = len(events["t"])
+        dims = CameraDims(self.cam_x, self.cam_y)
+        is_ie, te_next = self.ie_filter(events, self.IE_TIME_WINDOW, self.TE_DEPTH)
+        state = _SnowState(dims, self.spatial_window)
+        raw_state = _SnowState(dims, 0)
+        widths = TimeWidths(*(np.full(datalen, np.inf) for _ in TimeWidths._fields))
+        horizon = np.iinfo(np.int64).max if max_width is None else max_width
+
+        for lo, hi, ts in _relative_runs(events["t"], [state, raw_state]):
+            self._twidth_kernel(
+                events["x"][lo:hi], events["y"][lo:hi], events["p"][lo:hi], ts,
+                lo, self.time_window, self.spatial_window, horizon, is_ie,
+                state.pos_ts, state.pos_idx, state.blk_ts, raw_state.pos_ts, raw_state.pos_idx,
+                widths.spatial_win, widths.no_ie, widths.per_pixel, widths.adaptive_win
+            )
+        self._te_width_kernel(
+            is_ie, te_next, widths.spatial_win, widths.per_pixel, widths.adaptive_win)
+        widths.no_lbl_prop[is_ie] = widths.per_pixel[is_ie]
+        return widths
+
+    def snow_mask(self, events: Any, adaptive_window: bool = False) -> NDArray[np.bool]:
+        if len(self.tiles) > 1:
+            return self._tiled_snow_mask(events, adaptive_window)
+        is_ie, te_next = self.ie_filter(events, self.IE_TIME_WINDOW, self.TE_DEPTH)
+        return self.ebsnor_filter(events, is_ie, te_next, adaptive_window)
+
+    def kept_indices(self, events: Any, adaptive_window: bool = False) -> NDArray[np.intp]:
+        return np.flatnonzero(np.logical_not(self.snow_mask(events, adaptive_window)))
+
+    def process(self, events: Any, adaptive_window: bool = False, out: Any = None) -> Any:
+        """Return the non-snow events.
+
+        If `out` is given, the kept events are written into its leading
+        entries and that view is returned instead of a new array.
+        """
+        keep = np.logical_not(self.snow_mask(events, adaptive_window))
+        if out is None:
+            return events[keep]
+
+        num_kept = np.count_nonzero(keep)
+        if num_kept > len(out):
+            raise ValueError(f"Output buffer too small: {num_kept} > {len(out)} events")
+        kept = out[:num_kept]
+        np.compress(keep, events, out=kept)
+        return kept
+
+    def process_stream(
+        self,
+        events: Any,
+        adaptive_window: bool = False,
+        current_time: int | None = None
+    ) -> Any:
+        """Filter one slice of a continuous, time-ordered event stream.
+
+        Per-pixel state is kept between calls, so IE/TE chains and snow pairs
+        that cross a slice boundary are handled as if the whole stream was
+        processed at once. A positive IE can still be labelled as snow up to
+        `time_window` after it fired, so events are held back by that amount
+        and returned on a later call. Call `flush()` at the end of the stream.
+        `current_time`, e.g. the end of a delta_t slice, is the time up to
+        which the stream is complete; events `time_window` older than it are
+        returned even if no newer event arrived. With several tiles, every
+        tile keeps its own state and the tiles run on the worker threads.
+        """
+        self._check_coords(events)
+        if self._buf_events is None:
+            self._buf_events = events[:0].copy()
+
+        start = len(self._buf_events)
+        self._map_tiles(self._stream_tile, events, start, adaptive_window)
+        buf_events = np.concatenate((self._buf_events, events))
+
+        num_final = 0
+        if len(buf_events) > 0:
+            last_ts = buf_events["t"][-1]
+            if current_time is not None:
+                last_ts = max(last_ts, current_time)
+            horizon = last_ts - self.time_window
+            num_final = int(np.searchsorted(buf_events["t"], horizon, side="right"))
+        self._buf_events = buf_events
+        return self._release(num_final)
+
+    def flush(self) -> Any:
+        """Return the events still held back by `process_stream()`."""
+        if self._buf_events is None:
+            return None
+        return self._release(len(self._buf_events))
+
+    def close(self) -> None:
+        """Shut down the tile worker threads. The filter cannot be used afterwards."""
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def _release(self, num_final: int) -> Any:
+        # Return the non-snow events among the first num_final held-back ones
+        # and drop them. Their snow labels are OR-ed over the tiles seeing them.
+        is_snow = np.zeros(num_final, dtype=bool)
+        for tile in self._stream_tiles:
+            if tile is not None:
+                num_done = int(np.searchsorted(tile.pos, num_final))
+                is_snow[tile.pos[:num_done][tile.is_snow[:num_done]]] = True
+                tile.drop(num_final)
+        processed = self._buf_events[:num_final][np.logical_not(is_snow)]
+        self._buf_events = self._buf_events[num_final:]
+        return processed
+
+    def _stream_tile(self, tile_idx: int, events: Any, start: int, adaptive_window: bool) -> None:
+        # One tile of process_stream(), `start` is the buffer position of events[0]
+        bounds = self._halo_bounds(self.tiles[tile_idx])
+        if self._stream_tiles[tile_idx] is None:
+            dims = CameraDims(bounds.x1 - bounds.x0, bounds.y1 - bounds.y0)
+            self._stream_tiles[tile_idx] = _StreamTile(dims, self.spatial_window)
+        tile = self._stream_tiles[tile_idx]
+        sel, xs, ys, ps = self._tile_events(events, bounds)
+        tile_start = len(tile.pos)
+        tile.extend(start + sel)
+
+        ie_state, snow_state = tile.ie_state, tile.snow_state
+        for lo, hi, ts in _relative_runs(events["t"][sel], [ie_state, snow_state]):
+            self._ie_kernel(
+                xs[lo:hi], ys[lo:hi], ps[lo:hi], ts,
+                tile_start + lo, tile.base, self.IE_TIME_WINDOW, self.TE_DEPTH,
+                ie_state.ie_idx, ie_state.prev_ts, ie_state.prev_p, ie_state.te_count,
+                ie_state.te_tail, snow_state.chain_snow, tile.is_ie, tile.te_next, tile.is_snow
+            )
+            self._snow_kernel(
+                xs[lo:hi], ys[lo:hi], ps[lo:hi], ts,
+                tile_start + lo, tile.base, self.time_window, self.spatial_window,
+                adaptive_window, snow_state.pos_ts, snow_state.pos_idx, snow_state.blk_ts,
+                ie_state.ie_idx, snow_state.chain_snow, tile.is_ie, tile.te_next, tile.is_snow
+            )
+
+    def _check_coords(self, events: Any) -> None:
+        # The numba kernels do not bounds-check the per-pixel states
+        xs = events["x"]
+        ys = events["y"]
+        if len(xs) == 0:
+            return
+        if min(xs.min(), ys.min()) < 0 or xs.max() >= self.cam_x or ys.max() >= self.cam_y:
+            raise ValueError(
+                f"Event coordinates outside the {self.cam_x}x{self.cam_y} sensor: "
+                f"x in [{xs.min()}, {xs.max()}], y in [{ys.min()}, {ys.max()}]"
+            )
+
+    def _make_tiles(self, tile_grid: Tuple[int, int]) -> List[TileBounds]:
+        x_edges = np.linspace(0, self.cam_x, tile_grid[0] + 1).astype(int)
+        y_edges = np.linspace(0, self.cam_y, tile_grid[1] + 1).astype(int)
+        return [
+            TileBounds(int(x0), int(x1), int(y0), int(y1))
+            for x0, x1 in zip(x_edges[:-1], x_edges[1:])
+            for y0, y1 in zip(y_edges[:-1], y_edges[1:])
+        ]
+
+    def _halo_bounds(self, tile: TileBounds) -> TileBounds:
+        return TileBounds(
+            max(tile.x0 - self.spatial_window, 0),
+            min(tile.x1 + self.spatial_window, self.cam_x),
+            max(tile.y0 - self.spatial_window, 0),
+            min(tile.y1 + self.spatial_window, self.cam_y)
+        )
+
+    def _tile_events(
+        self,
+        events: Any,
+        bounds: TileBounds
+    ) -> Tuple[NDArray[np.intp], NDArray, NDArray, NDArray]:
+        # Indices of the events within bounds and their tile-relative x/y and polarities
+        xs = events["x"]
+        ys = events["y"]
+        if bounds == TileBounds(0, self.cam_x, 0, self.cam_y):
+            return np.arange(len(xs)), xs, ys, events["p"]
+        in_x = (xs >= bounds.x0) & (xs < bounds.x1)
+        sel = np.flatnonzero(in_x & (ys >= bounds.y0) & (ys < bounds.y1))
+        xs = (xs[sel] - bounds.x0).astype(np.uint16)
+        ys = (ys[sel] - bounds.y0).astype(np.uint16)
+        return sel, xs, ys, events["p"][sel]
+
+    def _map_tiles(self, tile_fn: Callable[..., Any], *args: Any) -> List[Any]:
+        # tile_fn(tile_idx, *args) for every tile, on the pool when there are several
+        if self._pool is None:
+            return [tile_fn(tile_idx, *args) for tile_idx in range(len(self.tiles))]
+        futures = [
+            self._pool.submit(tile_fn, tile_idx, *args) for tile_idx in range(len(self.tiles))
+        ]
+        return [future.result() for future in futures]
+
+    def _tiled_snow_mask(self, events: Any, adaptive_window: bool) -> NDArray[np.bool]:
+        # IE/TE chains are per pixel and a snow pair is at most spatial_window
+        # apart in x and in y, so each tile only needs a halo of that width.
+        # A tile can only miss marks near its halo edge, never add wrong ones,
+        # so OR-ing the tile masks gives the same result as a single pass over
+        # the sensor.
+        self._check_coords(events)
+        is_snow = np.zeros(len(events["t"]), dtype=bool)
+        for sel, tile_snow in self._map_tiles(self._tile_snow_mask, events, adaptive_window):
+            is_snow[sel[tile_snow]] = True
+        return is_snow
+
+    def _tile_snow_mask(
+        self,
+        tile_idx: int,
+        events: Any,
+        adaptive_window: bool
+    ) -> Tuple[NDArray[np.intp], NDArray[np.bool]]:
+        bounds = self._halo_bounds(self.tiles[tile_idx])
+        sel, xs, ys, ps = self._tile_events(events, bounds)
+
+        if self._tile_states[tile_idx] is None:
+            dims = CameraDims(bounds.x1 - bounds.x0, bounds.y1 - bounds.y0)
+            self._tile_states[tile_idx] = (
+                _IEState(dims), _SnowState(dims, self.spatial_window, track_chains=True))
+        ie_state, snow_state = self._tile_states[tile_idx]
+        is_ie = np.zeros(len(sel), dtype=bool)
+        te_next = -1*np.ones(len(sel), dtype=np.int32)
+        is_snow = np.zeros(len(sel), dtype=bool)
+        try:
+            for lo, hi, ts in _relative_runs(events["t"][sel], [ie_state, snow_state]):
+                self._ie_kernel(
+                    xs[lo:hi], ys[lo:hi], ps[lo:hi], ts,
+                    lo, 0, self.IE_TIME_WINDOW, self.TE_DEPTH,
+                    ie_state.ie_idx, ie_state.prev_ts, ie_state.prev_p, ie_state.te_count,
+                    ie_state.te_tail, snow_state.chain_snow, is_ie, te_next, is_snow
+                )
+                self._snow_kernel(
+                    xs[lo:hi], ys[lo:hi], ps[lo:hi], ts,
+                    lo, 0, self.time_window, self.spatial_window, adaptive_window,
+                    snow_state.pos_ts, snow_state.pos_idx, snow_state.blk_ts,
+                    ie_state.ie_idx, snow_state.chain_snow, is_ie, te_next, is_snow
+                )
+        finally:
+            ie_state.clear(xs, ys)
+            snow_state.clear(xs, ys)
+        return sel, is_snow
+
+    def reset(self) -> None:
+        """Drop all streaming state, e.g. before starting a new recording."""
+        for tile in self._stream_tiles:
+            if tile is not None:
+                tile.reset()
+        self._buf_events = None